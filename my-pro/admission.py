@@ -0,0 +1,104 @@
+"""Admission control for CPU-heavy work, shared by all gunicorn workers.
+
+Each running render holds an exclusive flock on one of ``slots`` files and
+each waiting request holds one of ``queue`` files, so the limits count every
+worker process. The kernel drops a lock when its holder exits, so a crashed
+worker can never leak a slot.
+"""
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Raised when no render slot could be had in time"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, directory, slots, queue=0, timeout=5.0, retry_after=5, poll_interval=0.05,
+                 metrics=None, name='render'):
+        self.directory = directory
+        self.slots = slots
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+        self.metrics = metrics
+        self.name = name
+        self._waiting = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _try_lock(self, prefix, count):
+        """Return an open, locked file for the first free of ``count`` lock files"""
+        os.makedirs(self.directory, exist_ok=True)
+        for i in range(count):
+            f = open(os.path.join(self.directory, f"{self.name}.{prefix}.{i}"), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    def _count(self, attr, delta):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + delta)
+            value = getattr(self, attr)
+        if self.metrics:
+            gauge = 'queue_depth' if attr == '_waiting' else 'active'
+            self.metrics.set(f"trustpaper_{self.name}_{gauge}", value)
+            # Written at once: a worker that is waiting or rendering cannot serve
+            # /metrics itself, so other workers must see its gauges from the file
+            self.metrics.flush(force=True)
+
+    def _record(self, result, waited=None):
+        if not self.metrics:
+            return
+        self.metrics.inc(f"trustpaper_{self.name}_admission_total", result=result)
+        if waited is not None:
+            self.metrics.observe(f"trustpaper_{self.name}_wait_seconds", waited)
+
+    def _acquire(self):
+        slot = self._try_lock('slot', self.slots)
+        if slot is not None:
+            self._record('admitted', 0.0)
+            return slot
+
+        ticket = self._try_lock('queue', self.queue)
+        if ticket is None:
+            self._record('rejected')
+            raise Overloaded('queue full', self.retry_after)
+
+        start = time.monotonic()
+        self._count('_waiting', 1)
+        try:
+            while time.monotonic() - start < self.timeout:
+                time.sleep(self.poll_interval)
+                slot = self._try_lock('slot', self.slots)
+                if slot is not None:
+                    self._record('admitted', time.monotonic() - start)
+                    return slot
+        finally:
+            self._count('_waiting', -1)
+            ticket.close()
+        self._record('timeout', time.monotonic() - start)
+        raise Overloaded('timed out waiting for a slot', self.retry_after)
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot for the duration of the block, or raise Overloaded"""
+        slot = self._acquire()
+        self._count('_active', 1)
+        try:
+            yield
+        finally:
+            self._count('_active', -1)
+            slot.close()
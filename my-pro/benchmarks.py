@@ -0,0 +1,358 @@
+"""Benchmarks for certificate rendering and the request path.
+
+Usage:
+    python benchmarks.py                          # everything, default sizes
+    python benchmarks.py --records 1000 10000     # dataset sizes for the route benchmarks
+    python benchmarks.py --only render --output before.json
+    python benchmarks.py --output after.json --compare before.json
+
+Render benchmarks time each template in phases (gradient, compiling the draw
+plan, per-student text, PNG encode) and every output encoding profile on one
+certificate, and each download size (scale) against shrinking a full-size
+render. Route benchmarks build a synthetic users.json of each size in a
+temporary directory and drive the Flask routes through the test client.
+Every result reports throughput and p50/p99 latency; the --output JSON can
+be fed back with --compare to see the change between runs.
+
+Startup benchmarks run each sample in a fresh interpreter: they time
+importing main, then fork a "worker" and time its first requests, either
+cold or after the gunicorn-style warm-up in the parent (first pages, then
+the first certificate render). They also report
+the worker's private memory (Linux only), i.e. what is not shared with
+the parent.
+
+School benchmarks index a synthetic directory of --schools names and time
+verification lookups of exact names, one-typo names and unknown names on a
+cold verdict cache, plus repeated (cached) lookups.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_MARKS = {'unit_1': '92', 'unit_2': '85.5', 'unit_3': '78', 'unit_4': '88', 'unit_5': '95'}
+CUSTOM_DESIGN = {'color_palette': ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe']}
+
+
+def summarize(samples):
+    """Throughput and latency percentiles (milliseconds) for a list of durations in seconds"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'ops_per_sec': len(ordered) / total if total else float('inf'),
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+        'mean_ms': total / len(ordered) * 1000,
+    }
+
+
+def timed(func, iterations, warmup=1):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_render(main, iterations):
+    results = {}
+    templates = [(name, None) for name in main.BUILT_IN_TEMPLATES]
+    templates.append(('custom', CUSTOM_DESIGN))
+    for template, custom_design in templates:
+        palette = tuple(custom_design['color_palette']) if custom_design else None
+        colors = main.certificate_colors(template, palette)
+        size = main.CERTIFICATE_SIZE
+
+        def render():
+            return main.create_certificate('Benchmark Student', 'Green Valley High School', '10th',
+                                           SAMPLE_MARKS, template, custom_design)
+
+        image = render()
+
+        def encode():
+            main.encode_certificate(image, 'png')
+
+        results[f'render.{template}.gradient'] = timed(
+            lambda: main.vertical_gradient(size, colors['bg_gradient_start'], colors['bg_gradient_end']),
+            iterations)
+        results[f'render.{template}.plan'] = timed(
+            lambda: main.compile_certificate_plan(template, palette), iterations)
+        results[f'render.{template}.text'] = timed(render, iterations)
+        results[f'render.{template}.encode'] = timed(encode, iterations)
+
+    # Encode cost of every output profile, on one representative certificate
+    image = main.create_certificate('Benchmark Student', 'Green Valley High School', '10th', SAMPLE_MARKS)
+    for profile in main.ENCODING_PROFILES:
+        results[f'encode.{profile}'] = timed(lambda: main.encode_certificate(image, profile), iterations)
+
+    # Render and encode at each download size, against shrinking a full-size render
+    for size, options in main.CERTIFICATE_SCALES.items():
+        def render_scaled():
+            certificate = main.create_certificate('Benchmark Student', 'Green Valley High School', '10th',
+                                                  SAMPLE_MARKS, scale=options['scale'])
+            main.encode_certificate(certificate, 'png')
+
+        results[f'scale.{size}'] = timed(render_scaled, iterations)
+
+    def render_resampled():
+        certificate = main.create_certificate('Benchmark Student', 'Green Valley High School', '10th', SAMPLE_MARKS)
+        certificate.thumbnail((450, 300), main.Image.LANCZOS)
+        main.encode_certificate(certificate, 'png')
+
+    results['scale.thumbnail.resampled'] = timed(render_resampled, iterations)
+    return results
+
+
+STARTUP_SCRIPT = '''
+import gc, json, os, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+if sys.argv[1] == 'preloaded':
+    main.warm_up()
+    gc.collect()
+    gc.freeze()
+main.certificate_cache.directory = os.path.join(os.getcwd(), 'startup_cache_%d' % os.getpid())
+read, write = os.pipe()
+if os.fork() == 0:
+    start = time.perf_counter()
+    client = main.app.test_client()
+    client.get('/')
+    client.get('/admin')
+    first_page = time.perf_counter() - start
+    start = time.perf_counter()
+    main.render_certificate({'name': 'Startup Student', 'school': 'Green Valley High School', 'class': '10th',
+                             'unit_marks': {'unit_1': '90'}}, 'modern', None)
+    first_render = time.perf_counter() - start
+    private_kb = 0
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    private_kb += int(line.split()[1])
+    except OSError:
+        pass
+    os.write(write, json.dumps([first_page, first_render, private_kb]).encode())
+    os._exit(0)
+os.close(write)
+first_page, first_render, private_kb = json.loads(os.read(read, 1024))
+print(json.dumps({'import': imported, 'first_page': first_page, 'first_render': first_render,
+                  'private_kb': private_kb}))
+'''
+
+
+def bench_startup(iterations):
+    results = {}
+    for mode in ('cold', 'preloaded'):
+        samples = []
+        for _ in range(iterations):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, mode], cwd=os.getcwd(),
+                                    env=dict(os.environ, PYTHONPATH=HERE), capture_output=True,
+                                    text=True, check=True).stdout
+            samples.append(json.loads(output.splitlines()[-1]))
+        if mode == 'cold':
+            results['startup.import'] = summarize([sample['import'] for sample in samples])
+        results[f'startup.first_page.{mode}'] = summarize([sample['first_page'] for sample in samples])
+        stats = summarize([sample['first_render'] for sample in samples])
+        private_kb = sorted(sample['private_kb'] for sample in samples)
+        stats['worker_private_mb'] = private_kb[len(private_kb) // 2] / 1024
+        results[f'startup.first_render.{mode}'] = stats
+    return results
+
+
+def synthetic_schools(count, seed=0):
+    rng = random.Random(seed)
+    syllables = ['ra', 'ma', 'pur', 'ga', 'nag', 'har', 'de', 'vi', 'ko', 'lal', 'bad', 'sing', 'pa', 'ti']
+    kinds = ['Government High School', 'Govt. Senior Secondary School', 'Public School', 'Convent School',
+             'Model School', 'Academy']
+
+    def place():
+        return ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).title()
+
+    names = set()
+    while len(names) < count:
+        names.add(f"{rng.choice(kinds)}, {place()}, {place()} District")
+    return sorted(names)
+
+
+def bench_schools(count, iterations):
+    from schools import SchoolDirectory
+
+    rng = random.Random(1)
+    names = synthetic_schools(count)
+    start = time.perf_counter()
+    directory = SchoolDirectory(names)
+    results = {f'schools.index.{count}': summarize([time.perf_counter() - start])}
+
+    sample = rng.sample(names, min(len(names), 200 * iterations))
+    queries = {
+        'exact': sample,
+        'typo': [name[:i] + name[i + 1:] for name in sample for i in [rng.randrange(1, len(name))]],
+        'unknown': [f"Xavier Institute {i}" for i in range(len(sample))],
+    }
+    for kind, names in queries.items():
+        # Every name is looked up once, so none is answered from the verdict cache
+        samples = []
+        for name in names:
+            begin = time.perf_counter()
+            directory.lookup(name)
+            samples.append(time.perf_counter() - begin)
+        results[f'schools.lookup.{kind}'] = summarize(samples)
+    results['schools.lookup.cached'] = timed(lambda: directory.lookup(sample[0]), iterations * 10)
+    return results
+
+
+def synthetic_users(count, seed=0):
+    rng = random.Random(seed)
+    classes = ['8th', '9th', '10th', '11th', '12th']
+    schools = [f'School {i} High School' for i in range(max(1, count // 500))]
+    users = []
+    for i in range(count):
+        users.append({
+            'name': f'Student {i:06d}',
+            'email': f'student{i}@example.com',
+            'class': rng.choice(classes),
+            'roll_no': str(i),
+            'school': rng.choice(schools),
+            'marks': f'{rng.randint(40, 100)}%',
+            'password': 'password',
+            'status': 'approved' if rng.random() < 0.9 else 'pending',
+            'signup_date': '2025-01-01T00:00:00',
+            'unit_marks': {f'unit_{u}': str(rng.randint(40, 100)) for u in range(1, 6)},
+        })
+    return users
+
+
+def bench_routes(main, storage, sizes, iterations):
+    results = {}
+    for count in sizes:
+        workdir = tempfile.mkdtemp(prefix='trustpaper-bench-')
+        try:
+            users = synthetic_users(count)
+            notifications = [{'type': 'signup_request', 'user': user, 'id': i + 1,
+                              'timestamp': '2025-01-01T00:00:00'}
+                             for i, user in enumerate(u for u in users if u['status'] == 'pending')]
+            users_file = os.path.join(workdir, 'users.json')
+            notifications_file = os.path.join(workdir, 'notifications.json')
+            with open(users_file, 'w') as f:
+                json.dump(users, f)
+            with open(notifications_file, 'w') as f:
+                json.dump(notifications, f)
+
+            main.store = storage.create_store(main.app.config['STORAGE_BACKEND'], users_file,
+                                              notifications_file, os.path.join(workdir, 'bench.db'))
+            main.cache = storage.ReadCache(main.store)
+            main.certificate_cache.directory = os.path.join(workdir, 'certificate_cache')
+            client = main.app.test_client()
+            target = users[count // 2]
+            client.post('/signin_submit', data={'name': target['name'], 'password': target['password']})
+
+            marks = iter(range(10 ** 9))
+            renders = iter(range(10 ** 9))
+
+            def download_uncached():
+                # A cold certificate cache for every call, so each one renders and encodes
+                main.certificate_cache._entries.clear()
+                main.certificate_cache._size = 0
+                main.certificate_cache.directory = os.path.join(workdir, 'certificate_cache', str(next(renders)))
+                return client.post('/download_certificate', data={'template': 'classic'})
+
+            routes = {
+                'admin_dashboard': lambda: client.get('/admin'),
+                'student_list': lambda: client.get('/admin/students'),
+                'student_search': lambda: client.get('/api/students?q=Student%2000'),
+                'signin': lambda: client.post('/signin_submit', data={'name': target['name'],
+                                                                     'password': target['password']}),
+                'student_dashboard': lambda: client.get('/student_dashboard'),
+                'update_marks': lambda: client.post('/update_marks', data={'unit_1': str(next(marks) % 100)}),
+                'download_certificate': download_uncached,
+                'download_certificate.cached': lambda: client.post('/download_certificate',
+                                                                   data={'template': 'classic'}),
+            }
+            for name, request in routes.items():
+                results[f'routes.{count}.{name}'] = timed(request, iterations)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_results(results, baseline=None):
+    header = f"{'benchmark':45} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10}"
+    if baseline:
+        header += f" {'p50 vs base':>12}"
+    print(header)
+    for name, stats in results.items():
+        line = f"{name:45} {stats['ops_per_sec']:10.1f} {stats['p50_ms']:10.2f} {stats['p99_ms']:10.2f}"
+        if baseline and name in baseline:
+            line += f" {stats['p50_ms'] / baseline[name]['p50_ms']:11.2f}x"
+        if 'worker_private_mb' in stats:
+            line += f"  ({stats['worker_private_mb']:.1f} MB private per worker)"
+        print(line)
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', choices=['render', 'routes', 'startup', 'schools'], help='run a single group')
+    parser.add_argument('--records', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='synthetic users.json sizes for the route benchmarks')
+    parser.add_argument('--schools', type=int, default=50000, help='synthetic school directory size')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--storage', choices=['sqlite', 'json'], default='sqlite')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    # main.py opens its stores relative to the working directory, so import it
+    # from a scratch directory to keep the benchmark away from real data.
+    scratch = tempfile.mkdtemp(prefix='trustpaper-bench-')
+    os.environ['TRUSTPAPER_STORAGE'] = args.storage
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    sys.path.insert(0, HERE)
+    try:
+        results = {}
+        if args.only in (None, 'startup'):
+            # Before importing main here, so every sample starts from a fresh interpreter
+            results.update(bench_startup(min(args.iterations, 5)))
+
+        import main
+        import storage
+
+        main.warm_up()
+        if args.only in (None, 'render'):
+            results.update(bench_render(main, args.iterations))
+        if args.only in (None, 'routes'):
+            results.update(bench_routes(main, storage, args.records, args.iterations))
+        if args.only in (None, 'schools'):
+            results.update(bench_schools(args.schools, args.iterations))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.time(), 'storage': args.storage, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,37 @@
+# Gunicorn settings picked up automatically from the working directory.
+# The Procfile still sets the bind address and worker count.
+import gc
+import os
+
+# Import the app once in the master; workers are forked from it and share
+# its memory copy-on-write instead of each importing everything again.
+preload_app = True
+
+
+def on_starting(server):
+    # Load fonts, template layers and compiled page templates in the master so
+    # every forked worker starts with them already in memory.
+    import main
+    # Metrics files of the previous run belong to workers that no longer exist
+    main.metrics.clear()
+    if 'RENDER_POOL_WORKERS' not in os.environ:
+        # Share the cores between the workers' render pools rather than give each all of them
+        main.app.config['RENDER_POOL_WORKERS'] = max(1, main.available_cores() // server.cfg.workers)
+    main.warm_up()
+    # Move everything built so far out of the collector's reach: a collection
+    # in a worker would otherwise write to (and so copy) every shared page.
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Each worker drains the email outbox from boot, so retries and messages
+    # left by a previous run go out without waiting for a new email
+    import main
+    main.outbox_sender.start()
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counters in /metrics but drop its gauges
+    import main
+    main.metrics.mark_process_dead(worker.pid)
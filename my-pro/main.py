@@ -1,56 +1,210 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
-from flask_mail import Mail, Message
-import json
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, Response, g
 import os
-import requests
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont, features
 import io
 import base64
+import csv
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+import uuid
+import zipfile
+from storage import ReadCache, create_store
+from outbox import Outbox, OutboxSender
+from sessions import SQLiteSessionInterface
+from metrics import Instrumented, Metrics
+from admission import ConcurrencyLimiter, Overloaded
+from performance import STAT_SCOPES, marks_summary
+from schools import load_directory
 
 app = Flask(__name__)
 app.secret_key = 'trustpaper_secret_key_2024'
 
+# Sessions live server-side; the cookie only carries a random session id
+app.config['SESSION_FILE'] = os.environ.get('SESSION_FILE', 'sessions.db')
+app.session_interface = SQLiteSessionInterface(app.config['SESSION_FILE'])
+
+# Metrics: every worker writes its own file to METRICS_DIR and /metrics adds them up
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', 'metrics')
+metrics = Metrics(app.config['METRICS_DIR'])
+metrics.histogram('trustpaper_request_duration_seconds', 'Request latency by route, method and status')
+metrics.histogram('trustpaper_storage_seconds', 'Time spent in store operations')
+metrics.histogram('trustpaper_render_phase_seconds', 'Certificate render time by phase')
+metrics.histogram('trustpaper_encode_seconds', 'Certificate encode time by output profile')
+metrics.counter('trustpaper_encoded_bytes_total', 'Bytes of encoded certificates by output profile')
+metrics.counter('trustpaper_certificate_cache_total', 'Certificate cache lookups by result')
+metrics.histogram('trustpaper_email_enqueue_seconds', 'Time spent queueing email in the outbox')
+metrics.histogram('trustpaper_smtp_batch_seconds', 'Time spent sending one outbox batch over SMTP')
+metrics.counter('trustpaper_emails_total', 'Emails handed to SMTP by result')
+metrics.gauge('trustpaper_render_active', 'Renders holding a render slot')
+metrics.gauge('trustpaper_render_queue_depth', 'Requests waiting for a render slot')
+metrics.counter('trustpaper_render_admission_total', 'Render admission decisions by result')
+metrics.histogram('trustpaper_render_wait_seconds', 'Time admitted renders waited for a slot')
+
 # Email configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
 app.config['MAIL_USERNAME'] = os.environ.get('GMAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('GMAIL_APP_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('GMAIL_USERNAME')
 
-mail = Mail(app)
+_mail = None
+
+def get_mail():
+    """Flask-Mail is only used by the outbox sender, so it is imported on first send"""
+    global _mail
+    if _mail is None:
+        from flask_mail import Mail
+        _mail = Mail(app)
+    return _mail
+
+# Outgoing email is queued here and sent by a background thread in each worker
+app.config['OUTBOX_FILE'] = os.environ.get('OUTBOX_FILE', 'outbox.db')
 
 # File to store user data and admin notifications
 USERS_FILE = 'users.json'
 NOTIFICATIONS_FILE = 'notifications.json'
 
-def load_data(filename):
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_data(filename, data):
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+# Storage backend: 'sqlite' (indexed, default) or 'json' (the files above plus
+# an append-only change log that is compacted into them periodically).
+# A new SQLite database is seeded from the JSON files on first start.
+app.config['STORAGE_BACKEND'] = os.environ.get('TRUSTPAPER_STORAGE', 'sqlite')
+app.config['DATABASE_FILE'] = os.environ.get('TRUSTPAPER_DB', 'trustpaper.db')
+
+store = Instrumented(create_store(app.config['STORAGE_BACKEND'], USERS_FILE, NOTIFICATIONS_FILE,
+                                  app.config['DATABASE_FILE']),
+                     metrics, 'trustpaper_storage_seconds')
+# Parsed users/notifications for read-heavy pages, refreshed when the store changes
+cache = ReadCache(store)
+
+def send_email_batch(messages):
+    """Send outbox messages over one SMTP connection; returns an error (or None) per message"""
+    from flask_mail import Message
+
+    results = []
+    with metrics.time('trustpaper_smtp_batch_seconds'):
+        with app.app_context(), get_mail().connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(Message(subject=message['subject'], recipients=[message['recipient']],
+                                            body=message['body']))
+                    results.append(None)
+                    metrics.inc('trustpaper_emails_total', result='sent')
+                except Exception as e:
+                    results.append(e)
+                    metrics.inc('trustpaper_emails_total', result='failed')
+    metrics.flush()
+    return results
+
+outbox = Outbox(app.config['OUTBOX_FILE'])
+outbox_sender = OutboxSender(outbox, send_email_batch)
 
 def send_email(to_email, subject, body):
-    """Send email notification"""
+    """Queue email notification for the background sender"""
     try:
-        msg = Message(subject=subject, recipients=[to_email], body=body)
-        mail.send(msg)
+        with metrics.time('trustpaper_email_enqueue_seconds'):
+            outbox.enqueue(to_email, subject, body)
+    except Exception as e:
+        print(f"Error queueing email: {e}")
+        return False
+    outbox_sender.start()
+    outbox_sender.wake()
+    return True
+
+def send_emails(messages):
+    """Queue several (to_email, subject, body) emails in one outbox write"""
+    if not messages:
         return True
+    try:
+        with metrics.time('trustpaper_email_enqueue_seconds'):
+            outbox.enqueue_many(messages)
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing emails: {e}")
         return False
+    outbox_sender.start()
+    outbox_sender.wake()
+    return True
+
+def approval_email(user_name):
+    subject = "✅ Account Approved - TrustPaper"
+    body = f"""Dear {user_name},
+
+Congratulations! Your account has been approved by the admin.
+
+You can now sign in to TrustPaper using your credentials.
+
+Click here to sign in: {request.url_root}signin
+
+Welcome to TrustPaper - Your Certificate Making Platform!
+
+Best regards,
+TrustPaper Team"""
+    return subject, body
+
+def rejection_email(user_name):
+    subject = "❌ Account Application Update - TrustPaper"
+    body = f"""Dear {user_name},
+
+We regret to inform you that your account application has been rejected by our admin team.
+
+This could be due to:
+- Incomplete or incorrect information provided
+- School verification issues
+- Other administrative reasons
+
+You may try signing up again with correct information if you believe this was an error.
+
+For any questions, please contact our support team.
+
+Best regards,
+TrustPaper Team"""
+    return subject, body
+
+def current_user():
+    """Load the signed-in student's record, at most once per request"""
+    if 'current_user' not in g:
+        g.current_user = None
+        if 'user_id' in session:
+            g.current_user = store.get_user(session['user_id'], session.get('roll_no'))
+    return g.current_user
+
+# Known schools, one per line or in the 'name' column of a CSV file. Without
+# it, schools are accepted on keywords alone.
+app.config['SCHOOL_DIRECTORY_FILE'] = os.environ.get('SCHOOL_DIRECTORY_FILE', 'schools.csv')
+app.config['SCHOOL_SUGGESTIONS'] = 10
+
+_school_directory = None
+_school_directory_loaded = False
+
+def get_school_directory():
+    """The school directory, indexed once per process (in the gunicorn master via warm_up)"""
+    global _school_directory, _school_directory_loaded
+    if not _school_directory_loaded:
+        _school_directory = load_directory(app.config['SCHOOL_DIRECTORY_FILE'])
+        _school_directory_loaded = True
+    return _school_directory
 
 def verify_school_online(school_name):
-    """Simple school verification - you can enhance this with actual APIs"""
-    # For demo purposes, we'll accept schools with common keywords
-    common_school_keywords = ['school', 'high', 'academy', 'college', 'university', 'institute', 'education']
-    school_lower = school_name.lower()
-    return any(keyword in school_lower for keyword in common_school_keywords)
+    """Name to save for a verified school (the directory's spelling when known), or None"""
+    directory = get_school_directory()
+    if directory is None:
+        # For demo purposes, we'll accept schools with common keywords
+        common_school_keywords = ['school', 'high', 'academy', 'college', 'university', 'institute', 'education']
+        school_lower = school_name.lower()
+        return school_name.strip() if any(keyword in school_lower for keyword in common_school_keywords) else None
+    verified, canonical = directory.lookup(school_name)
+    if not verified:
+        return None
+    return canonical or school_name.strip()
 
 @app.route('/')
 def home():
@@ -74,10 +228,14 @@ def submit_signup():
     marks = request.form['marks']
     password = request.form['password']
 
-    # Verify school
-    if verify_school_online(school):
+    if store.get_user(name, roll_no):
+        flash('An account with this name and roll number already exists.', 'error')
+        return redirect(url_for('signup'))
+
+    # Verify school, saving it as the directory spells it
+    school = verify_school_online(school)
+    if school:
         # Save user data
-        users = load_data(USERS_FILE)
         user_data = {
             'name': name,
             'email': email,
@@ -90,19 +248,15 @@ def submit_signup():
             'signup_date': datetime.now().isoformat(),
             'unit_marks': {}
         }
-        users.append(user_data)
-        save_data(USERS_FILE, users)
-
-        # Add to admin notifications
-        notifications = load_data(NOTIFICATIONS_FILE)
         notification = {
             'type': 'signup_request',
             'user': user_data,
-            'id': len(notifications) + 1,
             'timestamp': datetime.now().isoformat()
         }
-        notifications.append(notification)
-        save_data(NOTIFICATIONS_FILE, notifications)
+        with store.batch():
+            store.add_user(user_data)
+            # Add to admin notifications
+            store.add_notification(notification)
 
         flash('Sign up successful! Please wait for admin approval to sign in.', 'success')
         return redirect(url_for('signin'))
@@ -112,22 +266,22 @@ def submit_signup():
 
 @app.route('/admin')
 def admin_dashboard():
-    notifications = load_data(NOTIFICATIONS_FILE)
-    users = load_data(USERS_FILE)
-    total_students = len([user for user in users if user.get('status') == 'approved'])
-    return render_template('admin.html', notifications=notifications, total_students=total_students)
+    notifications = cache.notifications()
+    total_students = store.count_users('approved')
+    return render_template('admin.html', notifications=notifications, total_students=total_students,
+                           profiles=ENCODING_PROFILES, encoding=encoding_settings())
 
 @app.route('/signin_submit', methods=['POST'])
 def signin_submit():
     name = request.form['name']
     password = request.form['password']
 
-    users = load_data(USERS_FILE)
-    for user in users:
-        if user['name'] == name and user.get('password') == password:
+    for user in store.find_users(name):
+        if user.get('password') == password:
             if user.get('status') == 'approved':
+                session.regenerate()
                 session['user_id'] = user['name']
-                session['user_data'] = user
+                session['roll_no'] = user['roll_no']
                 flash('Sign in successful!', 'success')
                 return redirect(url_for('student_dashboard'))
             else:
@@ -139,39 +293,32 @@ def signin_submit():
 
 @app.route('/student_dashboard')
 def student_dashboard():
-    if 'user_id' not in session:
+    user_data = current_user()
+    if user_data is None:
         flash('Please sign in first.', 'error')
         return redirect(url_for('signin'))
 
-    user_data = session.get('user_data')
-    return render_template('student_dashboard.html', user=user_data)
+    return render_template('student_dashboard.html', user=user_data,
+                           templates={name: CERTIFICATE_TEMPLATES['templates'][name] for name in BUILT_IN_TEMPLATES})
 
 @app.route('/template_gallery')
 def template_gallery():
-    if 'user_id' not in session:
+    user = current_user()
+    if user is None:
         flash('Please sign in first.', 'error')
         return redirect(url_for('signin'))
 
     # Load user's custom designs
-    users = load_data(USERS_FILE)
-    user_name = session['user_id']
-    custom_designs = []
-    
-    for user in users:
-        if user['name'] == user_name:
-            custom_designs = user.get('custom_designs', [])
-            break
+    custom_designs = user.get('custom_designs', [])
 
     return render_template('template_gallery.html', custom_designs=custom_designs)
 
 @app.route('/update_marks', methods=['POST'])
 def update_marks():
-    if 'user_id' not in session:
+    user = current_user()
+    if user is None:
         return redirect(url_for('signin'))
 
-    users = load_data(USERS_FILE)
-    user_name = session['user_id']
-
     # Get unit marks from form
     unit_marks = {}
     for key in request.form:
@@ -179,19 +326,14 @@ def update_marks():
             unit_marks[key] = request.form[key]
 
     # Update user's unit marks
-    for user in users:
-        if user['name'] == user_name:
-            user['unit_marks'] = unit_marks
-            session['user_data'] = user
-            break
+    store.update_user(user['name'], user['roll_no'], {'unit_marks': unit_marks})
 
-    save_data(USERS_FILE, users)
     flash('Marks updated successfully!', 'success')
     return redirect(url_for('student_dashboard'))
 
 @app.route('/generate_ai_design', methods=['POST'])
 def generate_ai_design():
-    if 'user_id' not in session:
+    if current_user() is None:
         flash('Please sign in first.', 'error')
         return redirect(url_for('signin'))
 
@@ -230,18 +372,12 @@ def generate_ai_design():
     }
 
     # Save to user's custom designs
-    users = load_data(USERS_FILE)
-    user_name = session['user_id']
-    
-    for user in users:
-        if user['name'] == user_name:
-            if 'custom_designs' not in user:
-                user['custom_designs'] = []
-            user['custom_designs'].append(custom_design)
-            session['user_data'] = user
-            break
-
-    save_data(USERS_FILE, users)
+    with store.batch():
+        user = store.get_user(session['user_id'], session.get('roll_no'))
+        if user:
+            custom_designs = user.get('custom_designs', []) + [custom_design]
+            store.update_user(user['name'], user['roll_no'], {'custom_designs': custom_designs})
+
     flash(f'🎨 AI Design "{display_name}" created successfully!', 'success')
     return redirect(url_for('template_gallery'))
 
@@ -251,426 +387,988 @@ def logout():
     flash('Logged out successfully!', 'success')
     return redirect(url_for('home'))
 
-def create_certificate(student_name, school_name, class_name, unit_marks, template='classic', custom_design=None):
-    # Create high-resolution certificate image (1800x1200 pixels for better quality)
-    width, height = 1800, 1200
-    img = Image.new('RGB', (width, height), color='white')
-    draw = ImageDraw.Draw(img)
-
-    # Template-specific color palettes
-    if template == 'classic':
-        # Enhanced color palette (existing)
-        gold_color = '#FFD700'
-        dark_gold = '#B8860B'
-        royal_blue = '#1e3a8a'
-        navy_blue = '#0f1419'
-        accent_blue = '#3b82f6'
-        gray_color = '#374151'
-        light_gray = '#f8f9fa'
-        bg_gradient_start = (255, 255, 255)
-        bg_gradient_end = (240, 245, 255)
-    elif template == 'modern':
-        # Modern template colors
-        gold_color = '#F59E0B'
-        dark_gold = '#D97706'
-        royal_blue = '#3B82F6'
-        navy_blue = '#1E40AF'
-        accent_blue = '#60A5FA'
-        gray_color = '#4B5563'
-        light_gray = '#F3F4F6'
-        bg_gradient_start = (249, 250, 251)
-        bg_gradient_end = (243, 244, 246)
-    elif template == 'elegant':
-        # Elegant template colors
-        gold_color = '#B45309'
-        dark_gold = '#92400E'
-        royal_blue = '#7C2D12'
-        navy_blue = '#451A03'
-        accent_blue = '#A16207'
-        gray_color = '#57534E'
-        light_gray = '#FEF7ED'
-        bg_gradient_start = (254, 252, 232)
-        bg_gradient_end = (251, 246, 232)
-    elif template == 'custom' and custom_design:
-        # AI Custom design colors
-        palette = custom_design.get('color_palette', ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe'])
-        gold_color = palette[0] if len(palette) > 0 else '#667eea'
-        dark_gold = palette[1] if len(palette) > 1 else '#764ba2'
-        royal_blue = palette[2] if len(palette) > 2 else '#f093fb'
-        navy_blue = palette[3] if len(palette) > 3 else '#f5576c'
-        accent_blue = palette[4] if len(palette) > 4 else '#4facfe'
-        gray_color = '#374151'
-        light_gray = '#f8f9fa'
-        # Convert hex to RGB for gradient
-        def hex_to_rgb(hex_color):
-            hex_color = hex_color.lstrip('#')
-            return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        bg_gradient_start = hex_to_rgb(palette[0]) if len(palette) > 0 else (102, 126, 234)
-        bg_gradient_end = hex_to_rgb(palette[1]) if len(palette) > 1 else (118, 75, 162)
-        # Make gradient lighter
-        bg_gradient_start = tuple(min(255, c + 100) for c in bg_gradient_start)
-        bg_gradient_end = tuple(min(255, c + 120) for c in bg_gradient_end)
-    else:  # vibrant
-        # Vibrant template colors
-        gold_color = '#EAB308'
-        dark_gold = '#CA8A04'
-        royal_blue = '#7C3AED'
-        navy_blue = '#5B21B6'
-        accent_blue = '#8B5CF6'
-        gray_color = '#6B7280'
-        light_gray = '#F5F3FF'
-        bg_gradient_start = (245, 243, 255)
-        bg_gradient_end = (237, 233, 254)
-
-
-    # Create gradient background effect based on template
+# Enhanced font loading with better fallbacks
+FONT_PATHS = [
+    "/System/Library/Fonts/Times.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSerif-Bold.ttf",
+    "arial.ttf", "times.ttf"
+]
+
+# Every size drawn on a certificate (title, subtitle, header, body, name, small, watermark)
+CERTIFICATE_FONT_SIZES = (72, 36, 28, 24, 48, 20, 60)
+
+@lru_cache(maxsize=None)
+def find_font_file():
+    """Probe FONT_PATHS once per process and remember the first usable file"""
+    for font_path in FONT_PATHS:
+        try:
+            ImageFont.truetype(font_path, 12)
+            return font_path
+        except (OSError, IOError):
+            continue
+    return None
+
+@lru_cache(maxsize=None)
+def get_font(font_path, size):
+    if font_path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size)
+
+def load_font(size, weight='normal'):
+    return get_font(find_font_file(), size)
+
+def warm_up_fonts(sizes=CERTIFICATE_FONT_SIZES):
+    """Load every certificate font up front so requests never touch font files"""
+    for size in sizes:
+        load_font(size)
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+# Certificate templates are data: colors per template plus one element list,
+# compiled into a draw plan per template/palette/scale (see certificate_plan).
+# Add a template by adding an entry to this file and restarting.
+app.config['CERTIFICATE_TEMPLATES_FILE'] = os.environ.get('CERTIFICATE_TEMPLATES_FILE',
+                                                          os.path.join(app.root_path, 'certificate_templates.json'))
+
+CERTIFICATE_ELEMENT_TYPES = ('rect', 'ellipse', 'text', 'units', 'watermark')
+
+def load_certificate_templates(path):
+    """Read the template definitions and check every element before anything is drawn"""
+    with open(path, encoding='utf-8') as f:
+        definitions = json.load(f)
+    layouts = [definitions['layout']] + [template['layout'] for template in definitions['templates'].values()
+                                         if 'layout' in template]
+    for layout in layouts:
+        for element in layout['elements']:
+            if element.get('type') not in CERTIFICATE_ELEMENT_TYPES:
+                raise ValueError(f"Unknown certificate element type {element.get('type')!r} in {path}")
+    if definitions['fallback'] not in definitions['templates']:
+        raise ValueError(f"Fallback template {definitions['fallback']!r} is not defined in {path}")
+    return definitions
+
+CERTIFICATE_TEMPLATES = load_certificate_templates(app.config['CERTIFICATE_TEMPLATES_FILE'])
+
+def uses_palette(definition):
+    return any(isinstance(spec, dict) for spec in definition['colors'].values())
+
+# Templates students can pick; those built from a design's palette are only used for AI designs
+BUILT_IN_TEMPLATES = tuple(name for name, definition in CERTIFICATE_TEMPLATES['templates'].items()
+                           if not uses_palette(definition))
+
+def certificate_template_name(template, palette=None):
+    """Name of the definition ``template`` is drawn with; unknown templates (or palette templates without one) use the fallback"""
+    definition = CERTIFICATE_TEMPLATES['templates'].get(template)
+    if definition is None or (uses_palette(definition) and palette is None):
+        return CERTIFICATE_TEMPLATES['fallback']
+    return template
+
+def certificate_definition(template, palette=None):
+    return CERTIFICATE_TEMPLATES['templates'][certificate_template_name(template, palette)]
+
+@lru_cache(maxsize=None)
+def certificate_definition_hash(name):
+    """Hash of a resolved definition and its layout, so edits to the file change cache keys"""
+    definition = CERTIFICATE_TEMPLATES['templates'][name]
+    layout = definition.get('layout', CERTIFICATE_TEMPLATES['layout'])
+    return hashlib.sha256(json.dumps([definition, layout], sort_keys=True).encode('utf-8')).hexdigest()
+
+def certificate_colors(template, palette=None):
+    """Color scheme for a template; custom designs pass their palette"""
+    colors = {}
+    for name, spec in certificate_definition(template, palette)['colors'].items():
+        if isinstance(spec, dict):
+            # Taken from the design's palette, optionally lightened into an RGB tuple
+            color = palette[spec['palette']] if len(palette) > spec['palette'] else spec['default']
+            if 'lighten' in spec:
+                color = tuple(min(255, c + spec['lighten']) for c in hex_to_rgb(color))
+        else:
+            color = tuple(spec) if isinstance(spec, list) else spec
+        colors[name] = color
+    return colors
+
+def vertical_gradient(size, start, end):
+    """Top-to-bottom RGB gradient built as one column and stretched to full width.
+
+    Each row gets int(start + (end - start) * y / height) per channel, exactly
+    what drawing one line per row produced, so the result is pixel identical.
+    """
+    width, height = size
+    column = bytearray()
     for y in range(height):
         ratio = y / height
-        r = int(bg_gradient_start[0] + (bg_gradient_end[0] - bg_gradient_start[0]) * ratio)
-        g = int(bg_gradient_start[1] + (bg_gradient_end[1] - bg_gradient_start[1]) * ratio)
-        b = int(bg_gradient_start[2] + (bg_gradient_end[2] - bg_gradient_start[2]) * ratio)
-        color = (r, g, b)
-        draw.line([(0, y), (width, y)], fill=color)
-
-    # Draw ornate border design
-    border_width = 20
-    # Outer border
-    draw.rectangle([0, 0, width, height], outline=gold_color, width=border_width)
-    # Inner decorative border
-    inner_margin = 40
-    draw.rectangle([inner_margin, inner_margin, width-inner_margin, height-inner_margin], 
-                   outline=dark_gold, width=8)
-
-    # Add corner decorations
-    corner_size = 80
-    for corner_x, corner_y in [(inner_margin, inner_margin), (width-inner_margin-corner_size, inner_margin),
-                               (inner_margin, height-inner_margin-corner_size), (width-inner_margin-corner_size, height-inner_margin-corner_size)]:
-        # Draw decorative corners
-        draw.rectangle([corner_x, corner_y, corner_x+corner_size, corner_y+corner_size], 
-                       outline=gold_color, width=4)
-        # Inner corner decoration
-        draw.rectangle([corner_x+15, corner_y+15, corner_x+corner_size-15, corner_y+corner_size-15], 
-                       outline=dark_gold, width=2)
-
-    # Enhanced font loading with better fallbacks
-    def load_font(size, weight='normal'):
-        font_paths = [
-            f"/System/Library/Fonts/Times.ttc",
-            f"/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf",
-            f"/usr/share/fonts/truetype/liberation/LiberationSerif-Bold.ttf",
-            "arial.ttf", "times.ttf"
-        ]
-
-        for font_path in font_paths:
-            try:
-                return ImageFont.truetype(font_path, size)
-            except (OSError, IOError):
-                continue
-        return ImageFont.load_default()
-
-    # Load fonts with different sizes
-    title_font = load_font(72)
-    subtitle_font = load_font(36)
-    header_font = load_font(28)
-    body_font = load_font(24)
-    name_font = load_font(48)
-    small_font = load_font(20)
-
-    # Enhanced logo section
-    logo_bg_rect = [60, 60, 400, 140]
-    draw.rectangle(logo_bg_rect, fill=royal_blue, outline=gold_color, width=3)
-    draw.text((80, 85), "TRUST PAPER", fill='white', font=header_font)
-    draw.text((80, 115), "Certificate Authority", fill=light_gray, font=small_font)
-
-    # Main title with shadow effect
-    title_text = "CERTIFICATE"
-    title_bbox = draw.textbbox((0, 0), title_text, font=title_font)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (width - title_width) // 2
-
-    # Shadow effect
-    draw.text((title_x + 3, 183), title_text, fill=gray_color, font=title_font)
-    # Main title
-    draw.text((title_x, 180), title_text, fill=royal_blue, font=title_font)
-
-    # Subtitle with better spacing
-    subtitle_text = "OF ACADEMIC EXCELLENCE"
-    subtitle_bbox = draw.textbbox((0, 0), subtitle_text, font=subtitle_font)
-    subtitle_width = subtitle_bbox[2] - subtitle_bbox[0]
-    subtitle_x = (width - subtitle_width) // 2
-    draw.text((subtitle_x, 260), subtitle_text, fill=accent_blue, font=subtitle_font)
-
-    # Decorative line under subtitle
-    line_y = 310
-    line_start = subtitle_x
-    line_end = subtitle_x + subtitle_width
-    draw.rectangle([line_start, line_y, line_end, line_y + 4], fill=gold_color)
-
-    # Presented to section
-    presented_text = "THIS CERTIFICATE IS PROUDLY PRESENTED TO"
-    presented_bbox = draw.textbbox((0, 0), presented_text, font=body_font)
-    presented_width = presented_bbox[2] - presented_bbox[0]
-    presented_x = (width - presented_width) // 2
-    draw.text((presented_x, 360), presented_text, fill=gray_color, font=body_font)
-
-    # Student name with enhanced styling
-    name_bbox = draw.textbbox((0, 0), student_name.upper(), font=name_font)
-    name_width = name_bbox[2] - name_bbox[0]
-    name_x = (width - name_width) // 2
-
-    # Name background
-    name_bg_padding = 20
-    draw.rectangle([name_x - name_bg_padding, 405, name_x + name_width + name_bg_padding, 465], 
-                   fill=light_gray, outline=gold_color, width=2)
-    draw.text((name_x, 415), student_name.upper(), fill=navy_blue, font=name_font)
+        column.extend(int(s + (e - s) * ratio) for s, e in zip(start, end))
+    return Image.frombytes('RGB', (1, height), bytes(column)).resize((width, height), Image.NEAREST)
+
+# Layout coordinates and font sizes are in units of this reference canvas;
+# a render at scale s is CERTIFICATE_SIZE * s pixels with everything scaled alike.
+CERTIFICATE_SIZE = (1800, 1200)
+
+# Output sizes offered for download (PDF pages stay 12x8 inches at any scale)
+CERTIFICATE_SCALES = OrderedDict([
+    ('standard', {'label': 'Standard (1800×1200)', 'scale': 1.0}),
+    ('thumbnail', {'label': 'Thumbnail (450×300)', 'scale': 0.25}),
+    ('print', {'label': 'Print master (300 DPI)', 'scale': 2.0}),
+])
+
+def scaled(value, scale, minimum=0):
+    """Layout units to pixels at ``scale``; line widths pass minimum=1 so they never vanish"""
+    return max(minimum, int(round(value * scale)))
+
+def draw_certificate_text(draw, operation, text, canvas_width, fill):
+    """Draw one compiled text element, centring it on the canvas unless it has an x position"""
+    if operation['upper']:
+        text = text.upper()
+    font = operation['font']
+    x = operation['x']
+    if x is None or operation['background'] or operation['underline']:
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        if x is None:
+            x = (canvas_width - text_width) // 2
+    if operation['background']:
+        padding, top, bottom, box_fill, outline, width = operation['background']
+        draw.rectangle([x - padding, top, x + text_width + padding, bottom], fill=box_fill, outline=outline,
+                       width=width)
+    draw.text((x + operation['dx'], operation['y']), text, fill=fill, font=font)
+    if operation['underline']:
+        y, height, underline_fill = operation['underline']
+        draw.rectangle([x, y, x + text_width, y + height], fill=underline_fill)
+
+def compile_certificate_plan(template, palette=None, scale=1.0):
+    """Compile a template definition into a draw plan for one template/palette/scale.
+
+    Elements that do not depend on the student (borders, seal, headings and
+    any text without {fields}) are drawn into the background here, so their
+    text is measured and centred only once. The plan keeps the background,
+    the rotated watermark and the remaining per-student operations with
+    their fonts, colors and positions already resolved.
+    """
+    definition = certificate_definition(template, palette)
+    colors = certificate_colors(template, palette)
+    layout = definition.get('layout', CERTIFICATE_TEMPLATES['layout'])
+
+    def px(value):
+        return scaled(value, scale)
+
+    def line(value):
+        return scaled(value, scale, 1)
+
+    def color(value):
+        if isinstance(value, list):
+            return tuple(value)
+        return colors.get(value, value)
+
+    width, height = px(CERTIFICATE_SIZE[0]), px(CERTIFICATE_SIZE[1])
+    start, end = layout['background']
+    background = vertical_gradient((width, height), colors[start], colors[end])
+    draw = ImageDraw.Draw(background)
+    operations = []
+    watermark = None
+
+    for element in layout['elements']:
+        kind = element['type']
+        if kind == 'rect':
+            draw.rectangle([px(value) for value in element['box']], fill=color(element.get('fill')),
+                           outline=color(element.get('outline')), width=line(element.get('width', 1)))
+        elif kind == 'ellipse':
+            (x, y), radius = [px(value) for value in element['center']], px(element['radius'])
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color(element.get('fill')),
+                         outline=color(element.get('outline')), width=line(element.get('width', 1)))
+        elif kind == 'text':
+            background_box = element.get('background')
+            underline = element.get('underline')
+            operation = {
+                'type': 'text',
+                'text': element['text'],
+                'upper': element.get('upper', False),
+                'font': load_font(line(element['font'])),
+                'x': None if element.get('x', 'center') == 'center' else px(element['x']),
+                'dx': px(element.get('dx', 0)),
+                'y': px(element['y']),
+                'fill': color(element['fill']),
+                'grade_fill': {grade: color(value) for grade, value in element.get('grade_fill', {}).items()},
+                'background': background_box and (px(background_box['padding']), px(background_box['top']),
+                                                  px(background_box['bottom']), color(background_box.get('fill')),
+                                                  color(background_box.get('outline')),
+                                                  line(background_box.get('width', 1))),
+                'underline': underline and (px(underline['y']), line(underline['height']), color(underline['fill'])),
+            }
+            if '{' in element['text']:
+                operations.append(operation)
+            else:
+                draw_certificate_text(draw, operation, operation['text'], width, operation['fill'])
+        elif kind == 'units':
+            column_width = px(element['column_width'])
+            operations.append({
+                'type': 'units',
+                'text': element['text'],
+                'font': load_font(line(element['font'])),
+                'fill': color(element['fill']),
+                'columns': element['columns'],
+                'column_width': column_width,
+                'x': (width - element['columns'] * column_width) // 2,
+                # Layout units: each row's y is scaled as a whole, like every other position
+                'y': element['y'],
+                'row_height': element['row_height'],
+            })
+        elif kind == 'watermark':
+            font = load_font(line(element['font']))
+            text_bbox = draw.textbbox((0, 0), element['text'], font=font)
+            pad_x, pad_y = element['padding']
+            watermark_img = Image.new('RGBA', (text_bbox[2] - text_bbox[0] + px(2 * pad_x), px(element['height'])),
+                                      (255, 255, 255, 0))
+            ImageDraw.Draw(watermark_img).text((px(pad_x), px(pad_y)), element['text'], fill=color(element['fill']),
+                                               font=font)
+            # Pasted over the student's text in create_certificate
+            watermark = watermark_img.rotate(element['angle'], expand=1)
+
+    return {'colors': colors, 'background': background, 'watermark': watermark, 'operations': operations}
+
+# Every plan holds a full background (6.5 MB at scale 1.0), so the cache is
+# bounded by pixels; print-scale plans are rarely reused and never kept
+app.config['CERTIFICATE_PLAN_CACHE_PIXELS'] = int(os.environ.get('CERTIFICATE_PLAN_CACHE_PIXELS',
+                                                                 8 * CERTIFICATE_SIZE[0] * CERTIFICATE_SIZE[1]))
+
+_plans = OrderedDict()
+_plan_pixels = 0
+_plans_lock = threading.Lock()
+
+def certificate_plan(template, palette=None, scale=1.0):
+    """The draw plan for template/palette/scale, compiled on first use and kept in a pixel-bounded LRU"""
+    global _plan_pixels
+    key = (template, palette, scale)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = compile_certificate_plan(template, palette, scale)
+    if scale > 1.0:
+        return plan
+    with _plans_lock:
+        if key not in _plans:
+            _plans[key] = plan
+            _plan_pixels += plan['background'].width * plan['background'].height
+            while _plan_pixels > app.config['CERTIFICATE_PLAN_CACHE_PIXELS'] and len(_plans) > 1:
+                _, evicted = _plans.popitem(last=False)
+                _plan_pixels -= evicted['background'].width * evicted['background'].height
+    return plan
+
+def create_certificate(student_name, school_name, class_name, unit_marks, template='classic', custom_design=None,
+                       award_date=None, scale=1.0):
+    palette = None
+    if template == 'custom' and custom_design:
+        palette = tuple(custom_design.get('color_palette', ['#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe']))
+    with metrics.time('trustpaper_render_phase_seconds', phase='layers'):
+        # Keyed by the definition actually drawn, so unknown template ids share the fallback's plan
+        plan = certificate_plan(certificate_template_name(template, palette), palette, scale)
+    text_start = time.perf_counter()
+
+    # Start from the pre-rendered template and draw only the student's details
+    img = plan['background'].copy()
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
 
     # Calculate performance metrics
-    total_marks = 0
-    units_count = 0
-    highest_mark = 0
-    unit_details = []
+    performance = marks_summary(unit_marks)
+    fields = {
+        'name': student_name,
+        'school': school_name,
+        'class': class_name,
+        'average': performance['average'],
+        'grade': performance['grade'],
+        'award_date': award_date or datetime.now().strftime('%B %d, %Y'),
+    }
 
-    for unit, marks in unit_marks.items():
-        if marks and str(marks).strip():
-            try:
-                mark_value = float(marks)
-                total_marks += mark_value
-                units_count += 1
-                highest_mark = max(highest_mark, mark_value)
-                unit_details.append(f"{unit.replace('_', ' ').title()}: {mark_value}%")
-            except ValueError:
-                pass
+    for operation in plan['operations']:
+        if operation['type'] == 'units':
+            # Unit marks in columns, left to right then top to bottom
+            for i, (unit, mark_value) in enumerate(performance['units']):
+                row, col = divmod(i, operation['columns'])
+                text = operation['text'].format(unit=unit.replace('_', ' ').title(), value=mark_value)
+                draw.text((operation['x'] + col * operation['column_width'],
+                           scaled(operation['y'] + row * operation['row_height'], scale)),
+                          text, fill=operation['fill'], font=operation['font'])
+        else:
+            fill = operation['grade_fill'].get(fields['grade'], operation['fill'])
+            draw_certificate_text(draw, operation, operation['text'].format_map(fields), width, fill)
 
-    average_marks = total_marks / units_count if units_count > 0 else 0
-
-    # Performance grade calculation
-    if average_marks >= 90:
-        grade = "OUTSTANDING"
-        grade_color = gold_color
-    elif average_marks >= 80:
-        grade = "EXCELLENT" 
-        grade_color = accent_blue
-    elif average_marks >= 70:
-        grade = "GOOD"
-        grade_color = royal_blue
-    else:
-        grade = "SATISFACTORY"
-        grade_color = gray_color
-
-    # Achievement text with better formatting
-    achievement_lines = [
-        "In recognition of exceptional academic performance and dedication",
-        f"in {class_name} studies at {school_name}",
-        f"Achieving an overall average of {average_marks:.1f}% with grade: {grade}",
-        f"Awarded on {datetime.now().strftime('%B %d, %Y')}"
-    ]
-
-    start_y = 520
-    for i, text in enumerate(achievement_lines):
-        text_bbox = draw.textbbox((0, 0), text, font=body_font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_x = (width - text_width) // 2
+    metrics.observe('trustpaper_render_phase_seconds', time.perf_counter() - text_start, phase='text')
 
-        if i == 2:  # Grade line - highlight it
-            draw.text((text_x, start_y + i * 35), text, fill=grade_color, font=body_font)
-        else:
-            draw.text((text_x, start_y + i * 35), text, fill=gray_color, font=body_font)
-
-    # Detailed marks section
-    marks_y = 680
-    marks_title = "DETAILED PERFORMANCE:"
-    marks_title_bbox = draw.textbbox((0, 0), marks_title, font=header_font)
-    marks_title_width = marks_title_bbox[2] - marks_title_bbox[0]
-    marks_title_x = (width - marks_title_width) // 2
-    draw.text((marks_title_x, marks_y), marks_title, fill=royal_blue, font=header_font)
-
-    # Display unit marks in columns
-    if unit_details:
-        cols = 2
-        col_width = 400
-        start_x = (width - (cols * col_width)) // 2
-
-        for i, detail in enumerate(unit_details):
-            col = i % cols
-            row = i // cols
-            x = start_x + col * col_width
-            y = marks_y + 50 + row * 30
-            draw.text((x, y), detail, fill=gray_color, font=small_font)
-
-    # Enhanced signature section
-    sig_section_y = height - 200
-
-    # Signature box
-    sig_box = [width - 350, sig_section_y, width - 50, sig_section_y + 120]
-    draw.rectangle(sig_box, outline=gold_color, width=2)
-
-    # Authority signature
-    draw.text((width - 330, sig_section_y + 20), "Authorized Signature", fill=gray_color, font=small_font)
-    draw.rectangle([width - 330, sig_section_y + 50, width - 120, sig_section_y + 53], fill=gray_color)
-    draw.text((width - 330, sig_section_y + 65), "ADMIN", fill=royal_blue, font=header_font)
-    draw.text((width - 330, sig_section_y + 95), "Trust Paper Academy", fill=gray_color, font=small_font)
-
-    # Enhanced seal design
-    seal_center_x = width - 200
-    seal_center_y = 280
-    seal_radius = 80
-
-    # Multiple concentric circles for better seal effect
-    for i, radius in enumerate([seal_radius, seal_radius-15, seal_radius-30]):
-        width_val = 6 - i * 2
-        color = gold_color if i % 2 == 0 else dark_gold
-        draw.ellipse([seal_center_x - radius, seal_center_y - radius,
-                      seal_center_x + radius, seal_center_y + radius], 
-                     outline=color, width=width_val)
-
-    # Seal text
-    draw.text((seal_center_x - 35, seal_center_y - 15), "OFFICIAL", fill=gold_color, font=small_font)
-    draw.text((seal_center_x - 25, seal_center_y + 5), "SEAL", fill=gold_color, font=small_font)
-
-    # Add watermark
-    watermark_text = "TrustPaper Certified"
-    watermark_font = load_font(60)
-    watermark_bbox = draw.textbbox((0, 0), watermark_text, font=watermark_font)
-    watermark_width = watermark_bbox[2] - watermark_bbox[0]
-
-    # Create semi-transparent watermark effect
-    watermark_img = Image.new('RGBA', (watermark_width + 40, 80), (255, 255, 255, 0))
-    watermark_draw = ImageDraw.Draw(watermark_img)
-    watermark_draw.text((20, 10), watermark_text, fill=(200, 200, 200, 50), font=watermark_font)
-
-    # Rotate and paste watermark
-    rotated_watermark = watermark_img.rotate(45, expand=1)
-    img.paste(rotated_watermark, (width//2 - rotated_watermark.width//2, height//2 - rotated_watermark.height//2), rotated_watermark)
+    # Paste the pre-rotated watermark over everything
+    rotated_watermark = plan['watermark']
+    if rotated_watermark is not None:
+        with metrics.time('trustpaper_render_phase_seconds', phase='watermark'):
+            img.paste(rotated_watermark, (width//2 - rotated_watermark.width//2, height//2 - rotated_watermark.height//2), rotated_watermark)
 
     return img
 
-@app.route('/preview_certificate', methods=['POST'])
-def preview_certificate():
-    if 'user_id' not in session:
-        return redirect(url_for('signin'))
-
-    user_data = session.get('user_data')
-    template = request.form.get('template', 'classic')
-    custom_design_name = request.form.get('custom_design')
-    custom_design = None
+def warm_up():
+    """Build shared read-only assets; gunicorn calls this in the master before forking"""
+    warm_up_fonts()
+    get_school_directory()
+    for template in BUILT_IN_TEMPLATES:
+        certificate_plan(template)
+        certificate_plan(template, None, preview_scale())
+    # Compile every Jinja template into the environment's cache
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+# Bump when create_certificate output changes so stale disk entries are never served
+CERTIFICATE_RENDER_VERSION = 2
+
+app.config['CERTIFICATE_CACHE_DIR'] = os.environ.get('CERTIFICATE_CACHE_DIR', 'certificate_cache')
+app.config['CERTIFICATE_CACHE_MEMORY_BYTES'] = int(os.environ.get('CERTIFICATE_CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+app.config['CERTIFICATE_CACHE_DISK_BYTES'] = int(os.environ.get('CERTIFICATE_CACHE_DISK_BYTES', 1024 * 1024 * 1024))
+
+class CertificateCache:
+    """Encoded certificates keyed by a hash of everything that goes into the render.
+
+    A size-bounded in-memory LRU sits in front of a directory shared by all
+    gunicorn workers. Because the key covers the inputs, changing marks (or
+    anything else on the certificate) simply produces a new key; old entries
+    are never looked up again and age out of both tiers.
+    """
+
+    def __init__(self, directory, memory_bytes, disk_bytes, prune_every=100):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.prune_every = prune_every
+        self._entries = OrderedDict()
+        self._size = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        self._remember(key, data)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Error writing certificate cache: {e}")
+            return
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def _remember(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def prune(self):
+        """Delete the least recently written disk entries beyond the size limit"""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
 
+certificate_cache = CertificateCache(app.config['CERTIFICATE_CACHE_DIR'],
+                                     app.config['CERTIFICATE_CACHE_MEMORY_BYTES'],
+                                     app.config['CERTIFICATE_CACHE_DISK_BYTES'])
+
+# Output encodings: trade encode CPU against bytes on the wire. PNG ignores
+# 'quality'; its zlib level is what costs (or saves) time.
+ENCODING_PROFILES = OrderedDict([
+    ('png', {'label': 'PNG', 'format': 'PNG', 'mimetype': 'image/png', 'extension': 'png',
+             'options': {'compress_level': 6}}),
+    ('png-fast', {'label': 'PNG (fast, larger)', 'format': 'PNG', 'mimetype': 'image/png', 'extension': 'png',
+                  'options': {'compress_level': 1}}),
+    ('png-archive', {'label': 'PNG (smallest, slow)', 'format': 'PNG', 'mimetype': 'image/png', 'extension': 'png',
+                     'options': {'optimize': True}}),
+    ('jpeg', {'label': 'JPEG', 'format': 'JPEG', 'mimetype': 'image/jpeg', 'extension': 'jpg',
+              'options': {'quality': 90, 'optimize': True, 'progressive': True}}),
+    ('webp', {'label': 'WebP', 'format': 'WEBP', 'mimetype': 'image/webp', 'extension': 'webp',
+              'options': {'quality': 85, 'method': 4}}),
+    ('pdf', {'label': 'PDF (print)', 'format': 'PDF', 'mimetype': 'application/pdf', 'extension': 'pdf',
+             'options': {'resolution': 150.0}}),
+])
+if not features.check('webp'):
+    del ENCODING_PROFILES['webp']
+
+# Admins pick the default profile per use; the choice is kept in a file so every worker sees it
+app.config['ENCODING_SETTINGS_FILE'] = os.environ.get('ENCODING_SETTINGS_FILE', 'encoding_settings.json')
+app.config['ENCODING_DEFAULTS'] = {
+    'download': os.environ.get('CERTIFICATE_PROFILE', 'png'),
+    'bulk': os.environ.get('BULK_CERTIFICATE_PROFILE', 'png'),
+}
+
+_encoding_settings = (None, {})
+
+def encoding_settings():
+    """Default profile per use ('download', 'bulk'), including admin overrides"""
+    global _encoding_settings
+    path = app.config['ENCODING_SETTINGS_FILE']
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if mtime != _encoding_settings[0]:
+        overrides = {}
+        if mtime is not None:
+            try:
+                with open(path) as f:
+                    overrides = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading encoding settings: {e}")
+        _encoding_settings = (mtime, overrides)
+    settings = dict(app.config['ENCODING_DEFAULTS'])
+    settings.update({use: profile for use, profile in _encoding_settings[1].items()
+                     if use in settings and profile in ENCODING_PROFILES})
+    return settings
+
+def save_encoding_settings(settings):
+    path = app.config['ENCODING_SETTINGS_FILE']
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(settings, f)
+    os.replace(tmp, path)
+
+def resolve_profile(requested, use):
+    """The requested profile if it exists, else the default for this use"""
+    if requested in ENCODING_PROFILES:
+        return requested
+    profile = encoding_settings()[use]
+    return profile if profile in ENCODING_PROFILES else 'png'
+
+def encode_certificate(certificate_img, profile):
+    settings = ENCODING_PROFILES[profile]
+    if settings['format'] != 'PNG' and certificate_img.mode != 'RGB':
+        certificate_img = certificate_img.convert('RGB')
+    options = dict(settings['options'])
+    if 'resolution' in options:
+        # Keep the printed page the same size whatever scale it was rendered at
+        options['resolution'] *= certificate_img.width / CERTIFICATE_SIZE[0]
+    img_io = io.BytesIO()
+    with metrics.time('trustpaper_encode_seconds', profile=profile):
+        certificate_img.save(img_io, settings['format'], **options)
+    data = img_io.getvalue()
+    metrics.inc('trustpaper_encoded_bytes_total', len(data), profile=profile)
+    return data
+
+# Renders in request handlers are limited across all gunicorn workers so a
+# burst of downloads cannot tie up every worker. Waiting requests still hold
+# a worker, so keep RENDER_CONCURRENCY + RENDER_QUEUE_DEPTH below the worker
+# count to leave room for ordinary pages.
+app.config['RENDER_SLOT_DIR'] = os.environ.get('RENDER_SLOT_DIR', 'render_slots')
+app.config['RENDER_CONCURRENCY'] = int(os.environ.get('RENDER_CONCURRENCY', 1))
+app.config['RENDER_QUEUE_DEPTH'] = int(os.environ.get('RENDER_QUEUE_DEPTH', 1))
+app.config['RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('RENDER_QUEUE_TIMEOUT', 5))
+app.config['RENDER_RETRY_AFTER'] = int(os.environ.get('RENDER_RETRY_AFTER', 5))
+
+render_limiter = ConcurrencyLimiter(app.config['RENDER_SLOT_DIR'], app.config['RENDER_CONCURRENCY'],
+                                    queue=app.config['RENDER_QUEUE_DEPTH'],
+                                    timeout=app.config['RENDER_QUEUE_TIMEOUT'],
+                                    retry_after=app.config['RENDER_RETRY_AFTER'],
+                                    metrics=metrics)
+
+@app.errorhandler(Overloaded)
+def render_overloaded(e):
+    message = 'Too many certificates are being generated. Please try again shortly.'
+    if request.accept_mimetypes.best == 'application/json':
+        body = jsonify({'error': message})
+    else:
+        body = message
+    return body, 503, {'Retry-After': str(e.retry_after)}
+
+def certificate_cache_key(user_data, template, custom_design, award_date):
+    palette = custom_design.get('color_palette') if custom_design else None
+    definition = certificate_template_name(template, () if template == 'custom' and custom_design else None)
+    inputs = [CERTIFICATE_RENDER_VERSION, user_data['name'], user_data['school'], user_data['class'],
+              user_data['unit_marks'], template, palette, award_date, certificate_definition_hash(definition)]
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+def render_certificate(user_data, template, custom_design, profile='png', admit=False, scale=1.0):
+    """Return the certificate encoded with ``profile``, rendering only on a cache miss.
+
+    With ``admit`` a miss first takes a render slot and may raise Overloaded.
+    """
+    award_date = datetime.now().strftime('%B %d, %Y')
+    key = certificate_cache_key(user_data, template, custom_design, award_date)
+    if profile != 'png' or scale != 1.0:
+        key = hashlib.sha256(f"{key}:{profile}:{scale}".encode('utf-8')).hexdigest()
+    data = certificate_cache.get(key)
+    metrics.inc('trustpaper_certificate_cache_total', result='miss' if data is None else 'hit')
+    if data is None:
+        with render_limiter.slot() if admit else nullcontext():
+            certificate_img = create_certificate(
+                user_data['name'],
+                user_data['school'],
+                user_data['class'],
+                user_data['unit_marks'],
+                template,
+                custom_design,
+                award_date,
+                scale
+            )
+            data = encode_certificate(certificate_img, profile)
+        certificate_cache.put(key, data)
+    # Also runs in render pool processes, which have no request hooks to flush for them
+    metrics.flush()
+    return data
+
+def resolve_certificate_design(user_data, template, custom_design_name):
+    """Return the (template, custom_design) pair to render for a form selection"""
     # Check if it's a custom AI design
     if custom_design_name and custom_design_name.startswith('ai_design_'):
         for design in user_data.get('custom_designs', []):
             if design['name'] == custom_design_name:
-                custom_design = design
-                template = 'custom'
-                break
+                return 'custom', design
+    return template, None
+
+@app.route('/preview_certificate', methods=['POST'])
+def preview_certificate():
+    user_data = current_user()
+    if user_data is None:
+        return redirect(url_for('signin'))
+
+    custom_design_name = request.form.get('custom_design')
+    template, custom_design = resolve_certificate_design(
+        user_data, request.form.get('template', 'classic'), custom_design_name)
 
     if not user_data.get('unit_marks'):
         flash('Please enter your unit marks first before generating certificate.', 'error')
         return redirect(url_for('student_dashboard'))
 
-    # Generate certificate
-    certificate_img = create_certificate(
-        user_data['name'],
-        user_data['school'],
-        user_data['class'],
-        user_data['unit_marks'],
-        template,
-        custom_design
-    )
-
-    # Save to memory and convert to base64 for preview
-    img_io = io.BytesIO()
-    certificate_img.save(img_io, 'PNG', quality=95)
-    img_io.seek(0)
+    # Optionally render in the background and let the client poll for it
+    if request.form.get('async'):
+        return submit_render_job(user_data, template, custom_design, 'preview', 'png-fast')
 
-    # Convert to base64 for display
-    img_base64 = base64.b64encode(img_io.getvalue()).decode('utf-8')
+    # The page only links to the preview image, which is rendered and cached separately
+    certificate_url = url_for('certificate_preview_image', template=template,
+                              custom_design=custom_design and custom_design_name)
 
     return render_template('certificate_preview.html', 
-                         certificate_data=img_base64,
+                         certificate_url=certificate_url,
                          template=template,
+                         custom_design=custom_design and custom_design_name,
+                         profiles=ENCODING_PROFILES,
+                         default_profile=encoding_settings()['download'],
+                         sizes=CERTIFICATE_SCALES,
                          user=user_data)
 
+app.config['PREVIEW_SIZE'] = (900, 600)
+app.config['PREVIEW_QUALITY'] = 80
+
+def preview_format():
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+def preview_scale():
+    """Scale at which the preview is drawn directly, instead of shrinking a full-size render"""
+    return min(app.config['PREVIEW_SIZE'][0] / CERTIFICATE_SIZE[0], app.config['PREVIEW_SIZE'][1] / CERTIFICATE_SIZE[1])
+
+@app.route('/certificate_preview_image')
+def certificate_preview_image():
+    user_data = current_user()
+    if user_data is None:
+        return redirect(url_for('signin'))
+
+    template, custom_design = resolve_certificate_design(
+        user_data, request.args.get('template', 'classic'), request.args.get('custom_design'))
+    if not user_data.get('unit_marks'):
+        return Response(status=404)
+
+    # The ETag is derived from the render inputs, so it can be checked before rendering
+    award_date = datetime.now().strftime('%B %d, %Y')
+    image_format = preview_format()
+    key = hashlib.sha256(':'.join([
+        certificate_cache_key(user_data, template, custom_design, award_date), 'preview', image_format,
+        str(preview_scale()), str(app.config['PREVIEW_QUALITY'])]).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+    else:
+        data = certificate_cache.get(key)
+        if data is None:
+            with render_limiter.slot():
+                certificate_img = create_certificate(user_data['name'], user_data['school'], user_data['class'],
+                                                     user_data['unit_marks'], template, custom_design, award_date,
+                                                     preview_scale())
+                img_io = io.BytesIO()
+                certificate_img.convert('RGB').save(img_io, image_format, quality=app.config['PREVIEW_QUALITY'])
+                data = img_io.getvalue()
+            certificate_cache.put(key, data)
+        response = Response(data, mimetype=f"image/{image_format.lower()}")
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/download_certificate', methods=['POST'])
 def download_certificate():
-    if 'user_id' not in session:
+    user_data = current_user()
+    if user_data is None:
         return redirect(url_for('signin'))
 
-    user_data = session.get('user_data')
-    template = request.form.get('template', 'classic')
     custom_design_name = request.form.get('custom_design')
-    custom_design = None
-
-    # Check if it's a custom AI design
-    if custom_design_name and custom_design_name.startswith('ai_design_'):
-        for design in user_data.get('custom_designs', []):
-            if design['name'] == custom_design_name:
-                custom_design = design
-                template = 'custom'
-                break
+    template, custom_design = resolve_certificate_design(
+        user_data, request.form.get('template', 'classic'), custom_design_name)
 
     if not user_data.get('unit_marks'):
         flash('Please enter your unit marks first before generating certificate.', 'error')
         return redirect(url_for('student_dashboard'))
 
-    # Generate certificate
-    certificate_img = create_certificate(
-        user_data['name'],
-        user_data['school'],
-        user_data['class'],
-        user_data['unit_marks'],
-        template,
-        custom_design
-    )
-
-    # Save to memory
-    img_io = io.BytesIO()
-    certificate_img.save(img_io, 'PNG', quality=95)
-    img_io.seek(0)
+    profile = resolve_profile(request.form.get('profile'), 'download')
+    size = request.form.get('size')
+    if size not in CERTIFICATE_SCALES:
+        size = 'standard'
+
+    # Optionally render in the background and let the client poll for it
+    if request.form.get('async'):
+        return submit_render_job(user_data, template, custom_design, 'download', profile, size)
+
+    # Generate certificate (or reuse an identical earlier render)
+    img_io = io.BytesIO(render_certificate(user_data, template, custom_design, profile, admit=True,
+                                           scale=CERTIFICATE_SCALES[size]['scale']))
 
     # Create filename
-    filename = f"certificate_{user_data['name'].replace(' ', '_')}_{template}_{datetime.now().strftime('%Y%m%d')}.png"
+    filename = certificate_filename(user_data, template, profile, size)
 
-    return send_file(img_io, mimetype='image/png', as_attachment=True, download_name=filename)
+    return send_file(img_io, mimetype=ENCODING_PROFILES[profile]['mimetype'], as_attachment=True,
+                     download_name=filename)
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# gunicorn.conf.py divides the cores between the workers' pools when this is not set
+app.config['RENDER_POOL_WORKERS'] = int(os.environ.get('RENDER_POOL_WORKERS', available_cores()))
+app.config['RENDER_TIMEOUT'] = float(os.environ.get('RENDER_TIMEOUT', 120))
+
+_render_pool = None
+_render_pool_pid = None
+
+def get_render_pool():
+    """Process pool for CPU-heavy renders, created lazily in each gunicorn worker.
+
+    Pool processes come from a forkserver, so they do not inherit the
+    worker's outbox and metrics threads or its open connections.
+    """
+    global _render_pool, _render_pool_pid
+    if _render_pool is None or _render_pool_pid != os.getpid():
+        _render_pool = ProcessPoolExecutor(max_workers=app.config['RENDER_POOL_WORKERS'],
+                                           mp_context=multiprocessing.get_context('forkserver'))
+        _render_pool_pid = os.getpid()
+    return _render_pool
+
+def reset_render_pool():
+    """Drop a pool that lost a process (e.g. OOM-killed) so the next render starts a new one"""
+    global _render_pool
+    pool, _render_pool = _render_pool, None
+    if pool is not None and _render_pool_pid == os.getpid():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def submit_render(*args, **kwargs):
+    """Run render_certificate on the pool, replacing the pool once if it is broken"""
+    try:
+        return get_render_pool().submit(render_certificate, *args, **kwargs)
+    except BrokenProcessPool:
+        reset_render_pool()
+        return get_render_pool().submit(render_certificate, *args, **kwargs)
+
+class ZipStream:
+    """Write-only file for zipfile that hands out bytes as soon as they are written"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def certificate_filename(user_data, template, profile='png', size='standard'):
+    name = user_data['name'].replace(' ', '_').replace('/', '_')
+    extension = ENCODING_PROFILES[profile]['extension']
+    suffix = '' if size == 'standard' else f"_{size}"
+    return f"certificate_{name}_{template}_{datetime.now().strftime('%Y%m%d')}{suffix}.{extension}"
+
+def stream_certificate_zip(students, template, profile='png'):
+    """Yield a ZIP of certificates chunk by chunk, rendering on the process pool.
+
+    At most two renders per pool worker are in flight, so memory stays bounded
+    however many students are selected.
+    """
+    window = app.config['RENDER_POOL_WORKERS'] * 2
+    stream = ZipStream()
+    pending = deque()
+    skipped = []
+    students = iter(students)
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        while True:
+            while len(pending) < window:
+                student = next(students, None)
+                if student is None:
+                    break
+                if not student.get('unit_marks'):
+                    skipped.append(student)
+                    continue
+                pending.append((student, submit_render(student, template, None, profile)))
+            if not pending:
+                break
+            student, future = pending.popleft()
+            try:
+                data = future.result(timeout=app.config['RENDER_TIMEOUT'])
+            except (BrokenProcessPool, TimeoutError) as e:
+                print(f"Error rendering certificate ZIP: {e!r}")
+                for _, later in pending:
+                    later.cancel()
+                if isinstance(e, BrokenProcessPool):
+                    reset_render_pool()
+                raise
+            filename = f"{student['roll_no']}_{certificate_filename(student, template, profile)}"
+            archive.writestr(filename, data)
+            yield stream.drain()
+        if skipped:
+            archive.writestr('skipped.txt', 'No unit marks entered for:\n' + ''.join(
+                f"{student['name']} (roll no {student['roll_no']})\n" for student in skipped))
+    yield stream.drain()
+
+@app.route('/admin/certificates/bulk')
+def bulk_certificates():
+    template = request.args.get('template', 'classic')
+    if template not in BUILT_IN_TEMPLATES:
+        flash('Unknown certificate template.', 'error')
+        return redirect(url_for('view_all_students'))
+
+    students = store.iter_users(status=request.args.get('status', 'approved'),
+                                class_name=request.args.get('class') or None,
+                                school=request.args.get('school') or None)
+    profile = resolve_profile(request.args.get('profile'), 'bulk')
+    filename = f"certificates_{template}_{datetime.now().strftime('%Y%m%d')}.zip"
+    return Response(stream_certificate_zip(students, template, profile), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+# Background render jobs: state lives in files so any gunicorn worker can answer a poll
+app.config['RENDER_JOB_DIR'] = os.environ.get('RENDER_JOB_DIR', 'render_jobs')
+app.config['RENDER_JOB_QUEUE_DEPTH'] = int(os.environ.get('RENDER_JOB_QUEUE_DEPTH', 32))
+app.config['RENDER_JOB_TTL'] = int(os.environ.get('RENDER_JOB_TTL', 600))
+
+_active_jobs = 0
+_jobs_lock = threading.Lock()
+_last_job_cleanup = 0.0
+
+def _job_path(job_id, extension='json'):
+    return os.path.join(app.config['RENDER_JOB_DIR'], f"{job_id}.{extension}")
+
+def _write_job(job):
+    path = _job_path(job['id'])
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, path)
+
+def load_render_job(job_id):
+    """Return a job record, or None if it is unknown or has expired"""
+    if not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - job['created'] > app.config['RENDER_JOB_TTL']:
+        return None
+    return job
+
+def cleanup_render_jobs():
+    """Delete job records and results older than RENDER_JOB_TTL (at most once a minute)"""
+    global _last_job_cleanup
+    now = time.time()
+    if now - _last_job_cleanup < 60:
+        return
+    _last_job_cleanup = now
+    job_dir = app.config['RENDER_JOB_DIR']
+    for name in os.listdir(job_dir):
+        path = os.path.join(job_dir, name)
+        try:
+            if now - os.path.getmtime(path) > app.config['RENDER_JOB_TTL']:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _finish_render_job(job, future):
+    global _active_jobs
+    with _jobs_lock:
+        _active_jobs -= 1
+    try:
+        data = future.result()
+        with open(_job_path(job['id'], 'out'), 'wb') as f:
+            f.write(data)
+        job['status'] = 'done'
+    except Exception as e:
+        print(f"Error rendering certificate: {e}")
+        job['status'] = 'failed'
+    _write_job(job)
+
+def submit_render_job(user_data, template, custom_design, kind, profile='png', size='standard'):
+    """Queue a render on the process pool and return its job id straight away"""
+    global _active_jobs
+    with _jobs_lock:
+        if _active_jobs >= app.config['RENDER_JOB_QUEUE_DEPTH']:
+            return jsonify({'error': 'Too many certificates are being generated. Please try again shortly.'}), 503, \
+                {'Retry-After': str(app.config['RENDER_RETRY_AFTER'])}
+        _active_jobs += 1
+
+    job = {
+        'id': uuid.uuid4().hex,
+        'user': user_data['name'],
+        'roll_no': user_data['roll_no'],
+        'kind': kind,
+        'filename': certificate_filename(user_data, template, profile, size),
+        'mimetype': ENCODING_PROFILES[profile]['mimetype'],
+        'status': 'pending',
+        'created': time.time()
+    }
+    try:
+        os.makedirs(app.config['RENDER_JOB_DIR'], exist_ok=True)
+        cleanup_render_jobs()
+        _write_job(job)
+        scale = preview_scale() if kind == 'preview' else CERTIFICATE_SCALES[size]['scale']
+        future = submit_render(user_data, template, custom_design, profile, scale=scale)
+    except Exception as e:
+        # Nothing will finish this job, so release its place in the queue here
+        print(f"Error queueing certificate render: {e}")
+        with _jobs_lock:
+            _active_jobs -= 1
+        job['status'] = 'failed'
+        try:
+            _write_job(job)
+        except OSError:
+            pass
+        return jsonify({'error': 'Could not start generating the certificate. Please try again.'}), 503, \
+            {'Retry-After': str(app.config['RENDER_RETRY_AFTER'])}
+    future.add_done_callback(lambda f: _finish_render_job(job, f))
+    return jsonify(render_job_status(job)), 202
+
+def owns_render_job(job):
+    """True if the signed-in student submitted ``job`` (names alone are not unique)"""
+    return job['user'] == session.get('user_id') and job.get('roll_no') == session.get('roll_no')
+
+def render_job_status(job):
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': url_for('render_job', job_id=job['id'])
+    }
+    if job['status'] == 'done':
+        status['result_url'] = url_for('render_job_result', job_id=job['id'])
+    return status
+
+@app.route('/render_jobs/<job_id>')
+def render_job(job_id):
+    job = load_render_job(job_id)
+    if not job or not owns_render_job(job):
+        return jsonify({'error': 'Job not found or expired.'}), 404
+    return jsonify(render_job_status(job))
+
+@app.route('/render_jobs/<job_id>/result')
+def render_job_result(job_id):
+    job = load_render_job(job_id)
+    if not job or not owns_render_job(job):
+        return jsonify({'error': 'Job not found or expired.'}), 404
+    if job['status'] != 'done':
+        return jsonify(render_job_status(job)), 202
+    return send_file(os.path.abspath(_job_path(job_id, 'out')), mimetype=job['mimetype'],
+                     as_attachment=job['kind'] == 'download', download_name=job['filename'])
+
+@app.route('/admin/encoding', methods=['POST'])
+def update_encoding_settings():
+    settings = encoding_settings()
+    for use in settings:
+        profile = request.form.get(use)
+        if profile is not None:
+            if profile not in ENCODING_PROFILES:
+                flash('Unknown output format.', 'error')
+                return redirect(url_for('admin_dashboard'))
+            settings[use] = profile
+    try:
+        save_encoding_settings(settings)
+        flash('Certificate output formats updated.', 'success')
+    except Exception as e:
+        print(f"Error saving encoding settings: {e}")
+        flash('Could not save certificate output formats.', 'error')
+    return redirect(url_for('admin_dashboard'))
 
 @app.route('/admin/approve/<int:notification_id>')
 def approve_user(notification_id):
-    notifications = load_data(NOTIFICATIONS_FILE)
-    users = load_data(USERS_FILE)
-
     user_email = None
     user_name = None
 
-    for notification in notifications:
-        if notification['id'] == notification_id:
+    with store.batch():
+        notification = store.get_notification(notification_id)
+        if notification:
             # Update user status
-            for user in users:
-                if (user['name'] == notification['user']['name'] and 
-                    user['roll_no'] == notification['user']['roll_no']):
-                    user['status'] = 'approved'
-                    user_email = user.get('email')  # Use .get() to avoid KeyError
-                    user_name = user['name']
-                    break
+            user = store.update_user(notification['user']['name'], notification['user']['roll_no'],
+                                     {'status': 'approved'})
+            if user:
+                user_email = user.get('email')  # Use .get() to avoid KeyError
+                user_name = user['name']
             # Remove notification
-            notifications.remove(notification)
-            break
-
-    save_data(NOTIFICATIONS_FILE, notifications)
-    save_data(USERS_FILE, users)
+            store.delete_notification(notification_id)
 
     # Send approval email
     if user_email:
-        subject = "✅ Account Approved - TrustPaper"
-        body = f"""Dear {user_name},
-
-Congratulations! Your account has been approved by the admin.
-
-You can now sign in to TrustPaper using your credentials.
-
-Click here to sign in: {request.url_root}signin
-
-Welcome to TrustPaper - Your Certificate Making Platform!
-
-Best regards,
-TrustPaper Team"""
+        subject, body = approval_email(user_name)
 
         if send_email(user_email, subject, body):
             flash('User approved successfully! Approval email sent.', 'success')
@@ -681,46 +1379,331 @@ TrustPaper Team"""
 
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/notifications/bulk', methods=['POST'])
+def bulk_review_signups():
+    action = request.form.get('action')
+    if action not in ('approve', 'reject'):
+        flash('Unknown bulk action.', 'error')
+        return redirect(url_for('admin_dashboard'))
+
+    notification_ids = set()
+    for value in request.form.getlist('notification_ids'):
+        if value.isdigit():
+            notification_ids.add(int(value))
+
+    processed = 0
+    emails = []
+    email_for = approval_email if action == 'approve' else rejection_email
+    done = 'approved' if action == 'approve' else 'rejected'
+
+    # One transaction (one log append for the JSON backend) for the whole selection
+    with store.batch():
+        for notification_id in sorted(notification_ids):
+            notification = store.get_notification(notification_id)
+            if not notification:
+                continue
+            name, roll_no = notification['user']['name'], notification['user']['roll_no']
+            if action == 'approve':
+                user = store.update_user(name, roll_no, {'status': 'approved'})
+            else:
+                user = store.delete_user(name, roll_no)
+            store.delete_notification(notification_id)
+            processed += 1
+            if user and user.get('email'):
+                emails.append((user['email'],) + email_for(user['name']))
+
+    if not processed:
+        flash('No matching registration requests were selected.', 'error')
+    elif send_emails(emails):
+        flash(f'{processed} registration request(s) {done}! {len(emails)} email(s) queued.', 'success')
+    else:
+        flash(f'{processed} registration request(s) {done}! (Email notification failed)', 'success')
+
+    return redirect(url_for('admin_dashboard'))
+
+app.config['STUDENTS_PAGE_SIZE'] = 50
+app.config['STUDENTS_PAGE_SIZE_MAX'] = 200
+
+# Fields the student JSON API returns (never the password)
+STUDENT_API_FIELDS = ('name', 'email', 'class', 'roll_no', 'school', 'marks', 'status', 'signup_date', 'unit_marks')
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii') if key else None
+
+def decode_cursor(cursor):
+    try:
+        name, roll_no = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (str(name), str(roll_no))
+    except (ValueError, TypeError):
+        return None
+
+def student_filters(default_status=None):
+    """Read status/class/school/q filters from the query string"""
+    return {
+        'status': request.args.get('status') or default_status,
+        'class_name': request.args.get('class') or None,
+        'school': request.args.get('school') or None,
+        'prefix': request.args.get('q', '').strip() or None
+    }
+
+def query_students(filters):
+    """Return one page of students for the request's filters and cursor"""
+    try:
+        limit = int(request.args.get('limit', app.config['STUDENTS_PAGE_SIZE']))
+    except ValueError:
+        limit = app.config['STUDENTS_PAGE_SIZE']
+    limit = max(1, min(limit, app.config['STUDENTS_PAGE_SIZE_MAX']))
+    after = decode_cursor(request.args['after']) if request.args.get('after') else None
+    students, next_key = store.page_users(after=after, limit=limit, **filters)
+    return students, encode_cursor(next_key)
+
 @app.route('/admin/students')
 def view_all_students():
-    users = load_data(USERS_FILE)
-    approved_students = [user for user in users if user.get('status') == 'approved']
-    pending_students = [user for user in users if user.get('status') == 'pending']
+    filters = student_filters(default_status='approved')
+    if filters['status'] not in ('approved', 'pending'):
+        filters['status'] = 'approved'
+    students, next_cursor = query_students(filters)
 
+    query = {'status': filters['status'], 'class': filters['class_name'] or '',
+             'school': filters['school'] or '', 'q': filters['prefix'] or ''}
     return render_template('student_list.html', 
-                         approved_students=approved_students,
-                         pending_students=pending_students,
-                         total_approved=len(approved_students),
-                         total_pending=len(pending_students))
+                         approved_students=students if filters['status'] == 'approved' else [],
+                         pending_students=students if filters['status'] == 'pending' else [],
+                         total_approved=store.count_users('approved'),
+                         total_pending=store.count_users('pending'),
+                         query=query,
+                         next_url=next_cursor and url_for('view_all_students', after=next_cursor, **query))
+
+@app.route('/api/students')
+def api_students():
+    students, next_cursor = query_students(student_filters())
+    return jsonify({
+        'students': [{field: student.get(field) for field in STUDENT_API_FIELDS} for student in students],
+        'next': next_cursor
+    })
+
+@app.route('/api/schools')
+def api_schools():
+    """Directory names starting with ?q=, for the signup form's suggestions"""
+    directory = get_school_directory()
+    query = request.args.get('q', '')
+    if directory is None or len(query.strip()) < 2:
+        return jsonify({'schools': []})
+    return jsonify({'schools': directory.suggest(query, app.config['SCHOOL_SUGGESTIONS'])})
+
+EXPORT_FIELDS = ('name', 'email', 'class', 'roll_no', 'school', 'marks', 'status', 'signup_date')
+EXPORT_UNITS = tuple(f'unit_{i}' for i in range(1, 6))
+EXPORT_COLUMNS = EXPORT_FIELDS + EXPORT_UNITS + ('average', 'grade')
+EXPORT_CHUNK_ROWS = 200
+
+def export_row(student):
+    """One flat record: profile fields, each unit's marks, then average and grade"""
+    row = {field: student.get(field, '') for field in EXPORT_FIELDS}
+    unit_marks = student.get('unit_marks') or {}
+    for unit in EXPORT_UNITS:
+        row[unit] = unit_marks.get(unit, '')
+    performance = marks_summary(unit_marks)
+    row['average'] = round(performance['average'], 2) if performance['units'] else ''
+    row['grade'] = performance['grade'] if performance['units'] else ''
+    return row
+
+class _Echo:
+    """File-like object for csv.writer that returns each line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+def spreadsheet_safe(value):
+    # Keep spreadsheet apps from running student-entered text as a formula
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+def stream_students_export(students, export_format):
+    """Yield an export chunk by chunk; only EXPORT_CHUNK_ROWS rows are held at a time"""
+    writer = csv.writer(_Echo())
+    if export_format == 'csv':
+        yield writer.writerow(EXPORT_COLUMNS)
+    chunk = []
+    for student in students:
+        row = export_row(student)
+        if export_format == 'csv':
+            chunk.append(writer.writerow([spreadsheet_safe(row[column]) for column in EXPORT_COLUMNS]))
+        else:
+            chunk.append(json.dumps(row) + '\n')
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+@app.route('/admin/students/export')
+def export_students():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    students = store.iter_users(**student_filters())
+    filename = f"students_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_students_export(students, export_format), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+IMPORT_REQUIRED_FIELDS = ('name', 'email', 'class', 'roll_no', 'school', 'password')
+app.config['IMPORT_BATCH_SIZE'] = 500
+app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', 20000))
+
+def read_roster(file_storage):
+    """Yield (line number, row) pairs from an uploaded CSV without reading it all into memory"""
+    stream = io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames:
+        return
+    reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, {key: (value or '').strip() for key, value in row.items() if key}
+
+def validate_roster_batch(batch, seen, school_verdicts):
+    """Split a batch of rows into new users and (line, row, errors) rejections"""
+    existing = store.existing_user_keys([(row.get('name', ''), row.get('roll_no', '')) for _, row in batch])
+    accepted = []
+    rejected = []
+    for line, row in batch:
+        errors = [f"missing {field}" for field in IMPORT_REQUIRED_FIELDS if not row.get(field)]
+        key = (row.get('name', ''), row.get('roll_no', ''))
+        if not errors:
+            if key in existing:
+                errors.append('a student with this name and roll number already exists')
+            elif key in seen:
+                errors.append(f"duplicate of line {seen[key]}")
+            school = row['school']
+            if school not in school_verdicts:
+                school_verdicts[school] = verify_school_online(school)
+            if not school_verdicts[school]:
+                errors.append('school could not be verified')
+            school = school_verdicts[school]
+        if errors:
+            rejected.append((line, row, errors))
+            continue
+        seen[key] = line
+        accepted.append((line, {
+            'name': row['name'],
+            'email': row['email'],
+            'class': row['class'],
+            'roll_no': row['roll_no'],
+            'school': school,
+            'marks': row.get('marks', ''),
+            'password': row['password'],
+            'status': 'pending',
+            'signup_date': datetime.now().isoformat(),
+            'unit_marks': {unit: row[unit] for unit in EXPORT_UNITS if row.get(unit)}
+        }))
+    return accepted, rejected
+
+@app.route('/admin/students/import', methods=['POST'])
+def import_students():
+    """Create pending students (and their signup requests) from a CSV roster"""
+    roster = request.files.get('roster')
+    if not roster or not roster.filename:
+        flash('Please choose a CSV file to import.', 'error')
+        return redirect(url_for('view_all_students'))
+
+    accepted = []
+    rejected = []
+    seen = {}
+    school_verdicts = {}
+    batch = []
+    rows = 0
+    try:
+        for line, row in read_roster(roster):
+            rows += 1
+            if rows > app.config['IMPORT_MAX_ROWS']:
+                rejected.append((line, row, [f"only {app.config['IMPORT_MAX_ROWS']} rows can be imported at once"]))
+                break
+            batch.append((line, row))
+            if len(batch) >= app.config['IMPORT_BATCH_SIZE']:
+                new, bad = validate_roster_batch(batch, seen, school_verdicts)
+                accepted += new
+                rejected += bad
+                batch = []
+        new, bad = validate_roster_batch(batch, seen, school_verdicts)
+        accepted += new
+        rejected += bad
+    except (UnicodeDecodeError, csv.Error) as e:
+        print(f"Error reading roster: {e}")
+        flash('The file could not be read as a UTF-8 CSV.', 'error')
+        return redirect(url_for('view_all_students'))
+
+    # Every accepted student and signup request goes to the store in one write
+    imported = 0
+    timestamp = datetime.now().isoformat()
+    with store.batch():
+        for line, user in accepted:
+            if store.add_user(user):
+                store.add_notification({'type': 'signup_request', 'user': user, 'timestamp': timestamp})
+                imported += 1
+            else:
+                # Signed up while the file was being checked
+                rejected.append((line, user, ['a student with this name and roll number already exists']))
+    rejected.sort(key=lambda item: item[0])
+
+    report = {
+        'rows': min(rows, app.config['IMPORT_MAX_ROWS']),
+        'imported': imported,
+        'errors': [{'line': line, 'name': row.get('name', ''), 'roll_no': row.get('roll_no', ''),
+                    'errors': errors} for line, row, errors in rejected]
+    }
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(report)
+    return render_template('import_report.html', report=report, filename=roster.filename)
+
+# Class and school statistics are maintained by the store on every user write
+app.config['TOP_PERFORMERS'] = 5
+
+@app.route('/admin/analytics')
+def analytics():
+    scope = request.args.get('scope')
+    key = request.args.get('key')
+    selected = store.group_stat(scope, key, app.config['TOP_PERFORMERS']) \
+        if scope in STAT_SCOPES and key is not None else None
+    return render_template('analytics.html',
+                           classes=store.group_stats('class'),
+                           schools=store.group_stats('school'),
+                           selected=selected)
+
+@app.route('/api/stats/<scope>')
+def api_group_stats(scope):
+    if scope not in STAT_SCOPES:
+        return jsonify({'error': 'scope must be class or school'}), 404
+    return jsonify({'groups': store.group_stats(scope)})
+
+@app.route('/api/stats/<scope>/<path:key>')
+def api_group_stat(scope, key):
+    if scope not in STAT_SCOPES:
+        return jsonify({'error': 'scope must be class or school'}), 404
+    try:
+        top = max(1, min(int(request.args.get('top', app.config['TOP_PERFORMERS'])), 100))
+    except ValueError:
+        top = app.config['TOP_PERFORMERS']
+    stats = store.group_stat(scope, key, top)
+    if stats is None:
+        return jsonify({'error': 'No approved students in this group.'}), 404
+    return jsonify(stats)
 
 @app.route('/admin/remove_student/<student_name>/<roll_no>')
 def remove_student(student_name, roll_no):
-    users = load_data(USERS_FILE)
-    notifications = load_data(NOTIFICATIONS_FILE)
-
-    student_removed = False
     student_email = None
 
-    # Remove from users
-    for user in users[:]:  # Create a copy to iterate safely
-        if user['name'] == student_name and user['roll_no'] == roll_no:
+    with store.batch():
+        # Remove from users
+        user = store.delete_user(student_name, roll_no)
+        student_removed = user is not None
+        if student_removed:
             student_email = user.get('email')
-            users.remove(user)
-            student_removed = True
-            break
-
-    # Remove from notifications if exists
-    for notification in notifications[:]:
-        if (notification.get('type') == 'signup_request' and 
-            notification['user']['name'] == student_name and 
-            notification['user']['roll_no'] == roll_no):
-            notifications.remove(notification)
-            break
+            # Remove from notifications if exists
+            store.delete_signup_notification(student_name, roll_no)
 
     if student_removed:
-        save_data(USERS_FILE, users)
-        save_data(NOTIFICATIONS_FILE, notifications)
-
         # Send removal notification email
         if student_email:
             subject = "Account Removed - TrustPaper"
@@ -748,53 +1731,23 @@ TrustPaper Team"""
 
 @app.route('/admin/reject/<int:notification_id>')
 def reject_user(notification_id):
-    notifications = load_data(NOTIFICATIONS_FILE)
-    users = load_data(USERS_FILE)
-
     user_email = None
     user_name = None
-    user_to_remove = None
 
-    for notification in notifications:
-        if notification['id'] == notification_id:
+    with store.batch():
+        notification = store.get_notification(notification_id)
+        if notification:
             # Find and remove user data
-            for user in users:
-                if (user['name'] == notification['user']['name'] and 
-                    user['roll_no'] == notification['user']['roll_no']):
-                    user_email = user.get('email')  # Use .get() to avoid KeyError
-                    user_name = user['name']
-                    user_to_remove = user
-                    break
-
-            # Remove user from users list
-            if user_to_remove:
-                users.remove(user_to_remove)
-
+            user = store.delete_user(notification['user']['name'], notification['user']['roll_no'])
+            if user:
+                user_email = user.get('email')  # Use .get() to avoid KeyError
+                user_name = user['name']
             # Remove notification
-            notifications.remove(notification)
-            break
-
-    save_data(NOTIFICATIONS_FILE, notifications)
-    save_data(USERS_FILE, users)
+            store.delete_notification(notification_id)
 
     # Send rejection email
     if user_email:
-        subject = "❌ Account Application Update - TrustPaper"
-        body = f"""Dear {user_name},
-
-We regret to inform you that your account application has been rejected by our admin team.
-
-This could be due to:
-- Incomplete or incorrect information provided
-- School verification issues
-- Other administrative reasons
-
-You may try signing up again with correct information if you believe this was an error.
-
-For any questions, please contact our support team.
-
-Best regards,
-TrustPaper Team"""
+        subject, body = rejection_email(user_name)
 
         if send_email(user_email, subject, body):
             flash('User rejected! Rejection email sent.', 'info')
@@ -805,5 +1758,24 @@ TrustPaper Team"""
 
     return redirect(url_for('admin_dashboard'))
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_start' in g:
+        metrics.observe('trustpaper_request_duration_seconds', time.perf_counter() - g.request_start,
+                        route=request.url_rule.rule if request.url_rule else 'unmatched',
+                        method=request.method, status=response.status_code)
+        metrics.flush()
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # Under gunicorn the post_fork hook starts the sender in every worker
+    outbox_sender.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
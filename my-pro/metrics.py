@@ -0,0 +1,235 @@
+"""Prometheus text-format metrics that add up correctly across gunicorn workers.
+
+Each process keeps its counters, gauges and histograms in memory and writes
+them to ``<directory>/<pid>.json`` at most once per ``flush_interval``; a
+background thread per process writes out anything still unflushed, so the
+last samples of a worker that goes idle are not lost. The
+/metrics endpoint merges the files of every process. Counters and histograms
+of workers that have exited are kept so totals never go backwards; gauges
+only include processes that are still alive.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._definitions = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+        self._dirty = False
+        self._flusher_pid = None
+
+    # Definitions
+
+    def counter(self, name, help_text):
+        self._definitions[name] = ('counter', help_text, None)
+
+    def gauge(self, name, help_text):
+        self._definitions[name] = ('gauge', help_text, None)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self._definitions[name] = ('histogram', help_text, tuple(buckets))
+
+    # Recording
+
+    def _series(self, name, labels):
+        if self._pid != os.getpid():
+            # A forked child starts from zero instead of double counting its parent
+            self._values = {}
+            self._pid = os.getpid()
+            self._last_flush = 0.0
+        self._dirty = True
+        if self.directory and self._flusher_pid != self._pid:
+            # Threads do not survive fork, so each process starts its own
+            self._flusher_pid = self._pid
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+        return self._values.setdefault(name, {}), json.dumps(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series, key = self._series(name, labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            series, key = self._series(name, labels)
+            series[key] = value
+
+    def observe(self, name, value, **labels):
+        buckets = self._definitions[name][2]
+        with self._lock:
+            series, key = self._series(name, labels)
+            # Per-bucket counts (made cumulative when rendered), then sum and count
+            values = series.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Multi-process files
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush(force=True)
+                except OSError as e:
+                    print(f"Error flushing metrics: {e}")
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def flush(self, force=False):
+        """Write this process's values for other workers' /metrics to read"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            data = json.dumps(self._values)
+            self._last_flush = now
+            self._dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(self._pid)
+        # The request threads and the background flusher may write at once
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def clear(self):
+        """Remove every process file; call once when the server (re)starts"""
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+    def mark_process_dead(self, pid):
+        """Drop the gauges of an exited worker but keep its counters and histograms"""
+        if not self.directory:
+            return
+        path = self._path(pid)
+        try:
+            with open(path) as f:
+                values = json.load(f)
+        except (OSError, ValueError):
+            return
+        values = {name: series for name, series in values.items()
+                  if self._definitions.get(name, ('counter',))[0] != 'gauge'}
+        with open(path + '.tmp', 'w') as f:
+            json.dump(values, f)
+        os.replace(path + '.tmp', path)
+
+    def _collect(self):
+        with self._lock:
+            processes = [json.loads(json.dumps(self._values))]
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == f"{os.getpid()}.json":
+                    continue
+                pid = int(name[:-5])
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        values = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not _alive(pid):
+                    values = {metric: series for metric, series in values.items()
+                              if self._definitions.get(metric, ('counter',))[0] != 'gauge'}
+                processes.append(values)
+
+        merged = {}
+        for values in processes:
+            for name, series in values.items():
+                target = merged.setdefault(name, {})
+                for key, value in series.items():
+                    if isinstance(value, list):
+                        current = target.get(key)
+                        target[key] = [a + b for a, b in zip(current, value)] if current else value
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def render(self):
+        """All metrics of all processes in the Prometheus text exposition format"""
+        merged = self._collect()
+        lines = []
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(merged.get(name, {}).items()):
+                labels = json.loads(key)
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [['le', repr(bound)]])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + [['le', '+Inf']])} {value[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumented:
+    """Proxy that times every public method call of the wrapped object"""
+
+    def __init__(self, target, metrics, name):
+        self._target = target
+        self._metrics = metrics
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self._metrics.time(self._name, operation=attr):
+                return value(*args, **kwargs)
+        return timed
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
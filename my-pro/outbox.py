@@ -0,0 +1,163 @@
+"""Durable email outbox drained by a background sender.
+
+Routes enqueue messages instead of talking to SMTP inside the request. Each
+gunicorn worker runs one sender thread; messages are leased in a SQLite
+transaction, so workers never send the same message twice, and a message
+whose worker dies is picked up again once its lease runs out.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class Outbox:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            created REAL NOT NULL,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (status, next_attempt);
+    """
+
+    def __init__(self, path, lease=120, max_attempts=8, backoff=30, max_backoff=3600):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return _closing(conn)
+
+    def enqueue(self, recipient, subject, body):
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO messages (recipient, subject, body, next_attempt, created) '
+                'VALUES (?, ?, ?, ?, ?)', (recipient, subject, body, now, now))
+        return cursor.lastrowid
+
+    def enqueue_many(self, messages):
+        """Queue (recipient, subject, body) tuples in one transaction"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO messages (recipient, subject, body, next_attempt, created) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(recipient, subject, body, now, now) for recipient, subject, body in messages])
+
+    def claim(self, limit):
+        """Lease up to ``limit`` due messages to the caller"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                "SELECT id, recipient, subject, body, attempts FROM messages "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (now, limit)).fetchall()
+            conn.executemany('UPDATE messages SET next_attempt = ? WHERE id = ?',
+                             [(now + self.lease, row[0]) for row in rows])
+        return [dict(zip(('id', 'recipient', 'subject', 'body', 'attempts'), row)) for row in rows]
+
+    def sent(self, message_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+
+    def failed(self, message, error):
+        """Schedule a retry with exponential backoff, or give up after max_attempts"""
+        attempts = message['attempts'] + 1
+        status = 'failed' if attempts >= self.max_attempts else 'pending'
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        with self._connect() as conn:
+            conn.execute('UPDATE messages SET status = ?, attempts = ?, next_attempt = ?, last_error = ? '
+                         'WHERE id = ?', (status, attempts, time.time() + delay, str(error), message['id']))
+
+    def counts(self):
+        with self._connect() as conn:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM messages GROUP BY status').fetchall())
+
+
+class OutboxSender:
+    """Background thread that drains the outbox over one SMTP connection per batch"""
+
+    def __init__(self, outbox, send_batch, batch_size=50, poll_interval=5):
+        self.outbox = outbox
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread in this process (again after a fork)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='outbox-sender', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                while self.drain() == self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Error draining email outbox: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def drain(self):
+        """Send one batch of due messages; returns how many were claimed"""
+        messages = self.outbox.claim(self.batch_size)
+        if not messages:
+            return 0
+        try:
+            results = self.send_batch(messages)
+        except Exception as e:
+            # Could not even connect: every message in the batch is retried
+            results = [e] * len(messages)
+        for message, error in zip(messages, results):
+            if error is None:
+                self.outbox.sent(message['id'])
+            else:
+                print(f"Error sending email to {message['recipient']}: {error}")
+                self.outbox.failed(message, error)
+        return len(messages)
+
+
+class _closing:
+    """Commit (or roll back) and always close a short-lived connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type:
+                self.conn.rollback()
+            else:
+                self.conn.commit()
+        finally:
+            self.conn.close()
+        return False
@@ -0,0 +1,130 @@
+"""Marks, grades and the per-class / per-school statistics built from them.
+
+Group statistics are kept as running (total, count) pairs per metric so a
+store can add or subtract one student's contribution whenever that student
+changes, instead of rescanning every user to answer an analytics query.
+"""
+import bisect
+
+# Lowest average for each grade, best first
+GRADE_BANDS = ((90, 'OUTSTANDING'), (80, 'EXCELLENT'), (70, 'GOOD'))
+GRADES = tuple(grade for _, grade in GRADE_BANDS) + ('SATISFACTORY',)
+
+# Students are grouped by these user fields
+STAT_SCOPES = ('class', 'school')
+
+
+def grade_for(average):
+    for threshold, grade in GRADE_BANDS:
+        if average >= threshold:
+            return grade
+    return 'SATISFACTORY'
+
+
+def marks_summary(unit_marks):
+    """Valid unit marks as (unit, value) pairs with their average, highest mark and grade"""
+    units = []
+    for unit, marks in (unit_marks or {}).items():
+        if marks and str(marks).strip():
+            try:
+                units.append((unit, float(marks)))
+            except ValueError:
+                pass
+    average = sum(value for _, value in units) / len(units) if units else 0
+    return {
+        'units': units,
+        'average': average,
+        'highest': max([0] + [value for _, value in units]),
+        'grade': grade_for(average)
+    }
+
+
+def student_average(user):
+    """Average used for group statistics, or None for students who do not count"""
+    if user is None or user.get('status') != 'approved':
+        return None
+    summary = marks_summary(user.get('unit_marks'))
+    return summary['average'] if summary['units'] else None
+
+
+def stat_deltas(user):
+    """(scope, key, metric, total, count) rows this student adds to the group statistics"""
+    if user is None or user.get('status') != 'approved':
+        return []
+    summary = marks_summary(user.get('unit_marks'))
+    metrics = [('students', 0.0, 1)]
+    if summary['units']:
+        metrics.append(('average', summary['average'], 1))
+        metrics.append((f"grade:{summary['grade']}", 0.0, 1))
+        metrics.extend((f"unit:{unit}", value, 1) for unit, value in summary['units'])
+    return [(scope, user.get(scope) or '', metric, total, count)
+            for scope in STAT_SCOPES
+            for metric, total, count in metrics]
+
+
+def group_summary(scope, key, metrics, top_performers=None):
+    """Readable statistics from a {metric: (total, count)} mapping"""
+    average = metrics.get('average', (0.0, 0))
+    units = {metric[5:]: round(total / count, 2)
+             for metric, (total, count) in metrics.items() if metric.startswith('unit:') and count}
+    summary = {
+        'scope': scope,
+        'key': key,
+        'students': metrics.get('students', (0.0, 0))[1],
+        'graded': average[1],
+        'average': round(average[0] / average[1], 2) if average[1] else None,
+        'grades': {grade: metrics.get(f"grade:{grade}", (0.0, 0))[1] for grade in GRADES},
+        'unit_means': dict(sorted(units.items())),
+    }
+    if top_performers is not None:
+        summary['top_performers'] = top_performers
+    return summary
+
+
+def performer(name, roll_no, average):
+    return {'name': name, 'roll_no': roll_no, 'average': round(average, 2), 'grade': grade_for(average)}
+
+
+class GroupStats:
+    """In-memory group statistics with a ranked list per group for top performers"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._ranked = {}
+
+    def apply(self, user, sign):
+        """Add (sign=1) or remove (sign=-1) one student's contribution"""
+        for scope, key, metric, total, count in stat_deltas(user):
+            group = self._metrics.setdefault((scope, key), {})
+            current = group.get(metric, (0.0, 0))
+            current = (current[0] + sign * total, current[1] + sign * count)
+            if current[1]:
+                group[metric] = current
+            else:
+                group.pop(metric, None)
+            if not group:
+                del self._metrics[(scope, key)]
+        average = student_average(user)
+        if average is None:
+            return
+        entry = (-average, user['name'], user['roll_no'])
+        for scope in STAT_SCOPES:
+            ranked = self._ranked.setdefault((scope, user.get(scope) or ''), [])
+            if sign > 0:
+                bisect.insort(ranked, entry)
+            else:
+                i = bisect.bisect_left(ranked, entry)
+                if i < len(ranked) and ranked[i] == entry:
+                    del ranked[i]
+
+    def groups(self, scope):
+        return [group_summary(scope, key, metrics)
+                for (group_scope, key), metrics in sorted(self._metrics.items()) if group_scope == scope]
+
+    def group(self, scope, key, top=5):
+        metrics = self._metrics.get((scope, key))
+        if metrics is None:
+            return None
+        ranked = self._ranked.get((scope, key), [])[:top]
+        return group_summary(scope, key, metrics,
+                             [performer(name, roll_no, -average) for average, name, roll_no in ranked])
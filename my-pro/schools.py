@@ -0,0 +1,194 @@
+"""Local directory of known schools for signup verification.
+
+Names are normalised (case, accents, punctuation, common abbreviations) and
+indexed three ways: a dict for exact matches, a deletion index over the
+directory's words for one-typo-per-word corrections, and a sorted list that
+is searched like a trie for names that are the start of a directory entry.
+Verdicts are memoised per normalised name, so repeated lookups for the same
+school are dict hits.
+"""
+import bisect
+import csv
+import itertools
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+ABBREVIATIONS = {
+    'hs': 'high school',
+    'hss': 'higher secondary school',
+    'sr': 'senior',
+    'jr': 'junior',
+    'sec': 'secondary',
+    'govt': 'government',
+    'intl': 'international',
+    'st': 'saint',
+    'acad': 'academy',
+    'univ': 'university',
+    'inst': 'institute',
+    'coll': 'college',
+    '&': 'and',
+}
+
+# Shorter words are never spell-corrected: one edit turns them into too many others
+MIN_CORRECTABLE_LENGTH = 4
+# Most corrected spellings of one name that are tried against the index
+MAX_SPELLINGS = 16
+
+# A name that is only the start of directory entries ("Delhi Public School"
+# for its branches) must be this specific to count as verified: enough words,
+# enough of the shortest entry's words, and few enough entries
+MIN_PREFIX_WORDS = 2
+MIN_PREFIX_COVERAGE = 0.5
+MAX_PREFIX_MATCHES = 10
+
+
+def normalize_school_name(name):
+    """Lowercase ASCII words with abbreviations expanded, e.g. 'St. Mary's H.S.' -> 'saint marys high school'"""
+    name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    name = re.sub(r"(?<=\b\w)\.(?=\w\b)", '', name)  # h.s. -> hs
+    name = name.replace("'", '').replace('&', ' & ')
+    words = re.sub(r"[^a-z0-9&]+", ' ', name).split()
+    words = [ABBREVIATIONS.get(word, word) for word in words if word != 'the']
+    return ' '.join(' '.join(words).split())
+
+
+def deletions(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def one_edit_apart(a, b):
+    """True if one insertion, deletion, substitution or swap of neighbours turns a into b"""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]
+
+
+class SchoolDirectory:
+    def __init__(self, names):
+        self._canonical = {}
+        for name in names:
+            name = name.strip()
+            normalized = normalize_school_name(name)
+            if normalized:
+                self._canonical.setdefault(normalized, name)
+        self._sorted = sorted(self._canonical)
+        self._words = {word for normalized in self._sorted for word in normalized.split()}
+        # Every one-letter deletion of every known word, so a misspelt word
+        # finds its corrections with a few dict lookups instead of a scan
+        self._deletions = {}
+        for word in self._words:
+            if len(word) >= MIN_CORRECTABLE_LENGTH:
+                for deleted in deletions(word):
+                    self._deletions.setdefault(deleted, []).append(word)
+        self._lookup = lru_cache(maxsize=65536)(self._lookup_normalized)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load one school per line, or the 'name' (else first) column of a .csv file"""
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            if path.endswith('.csv'):
+                rows = csv.reader(f)
+                header = next(rows, [])
+                fields = [field.strip().lower() for field in header]
+                if 'name' in fields:
+                    column = fields.index('name')
+                else:
+                    # No header row: the first line is a school too
+                    column = 0
+                    rows = [header] + list(rows)
+                names = [row[column] for row in rows if len(row) > column]
+            else:
+                names = [line for line in f if line.strip() and not line.startswith('#')]
+        return cls(names)
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def lookup(self, name):
+        """(verified, canonical) for ``name``; canonical is None unless the whole name matched one school"""
+        normalized = normalize_school_name(name)
+        return self._lookup(normalized) if normalized else (False, None)
+
+    def _corrections(self, word):
+        """Known words equal to ``word`` or, failing that, one typo away from it"""
+        if word in self._words:
+            return [word]
+        if len(word) < MIN_CORRECTABLE_LENGTH:
+            return []
+        # A letter missing from word, an extra letter in it, or one changed or swapped
+        candidates = set(self._deletions.get(word, ()))
+        for deleted in deletions(word):
+            if deleted in self._words:
+                candidates.add(deleted)
+            candidates.update(self._deletions.get(deleted, ()))
+        return sorted(candidate for candidate in candidates if one_edit_apart(word, candidate))
+
+    def _completions(self, prefix, limit=MAX_PREFIX_MATCHES + 1):
+        """Up to ``limit`` directory names that start with the whole words of ``prefix``"""
+        found = []
+        i = bisect.bisect_left(self._sorted, prefix + ' ')
+        while i < len(self._sorted) and len(found) < limit and self._sorted[i].startswith(prefix + ' '):
+            found.append(self._sorted[i])
+            i += 1
+        return found
+
+    def _lookup_normalized(self, normalized):
+        canonical = self._canonical.get(normalized)
+        if canonical is not None:
+            return True, canonical
+
+        options = []
+        for word in normalized.split():
+            corrections = self._corrections(word)
+            if not corrections:
+                # Not a known word nor a typo of one: no school can match
+                return False, None
+            options.append(corrections)
+        spellings = [' '.join(words) for words in itertools.islice(itertools.product(*options), MAX_SPELLINGS)]
+
+        for spelling in spellings:
+            if spelling in self._canonical:
+                return True, self._canonical[spelling]
+        if len(options) < MIN_PREFIX_WORDS:
+            return False, None
+        for spelling in spellings:
+            completions = self._completions(spelling)
+            if not completions or len(completions) > MAX_PREFIX_MATCHES:
+                continue
+            shortest = min(len(completion.split()) for completion in completions)
+            if len(options) / shortest >= MIN_PREFIX_COVERAGE:
+                # A real school, but which entry is a guess: keep the name as typed
+                return True, None
+        return False, None
+
+    def suggest(self, prefix, limit=10):
+        """Directory names whose normalised form starts with the normalised ``prefix``"""
+        normalized = normalize_school_name(prefix)
+        if not normalized:
+            return []
+        start = bisect.bisect_left(self._sorted, normalized)
+        names = []
+        for key in self._sorted[start:start + limit]:
+            if not key.startswith(normalized):
+                break
+            names.append(self._canonical[key])
+        return names
+
+
+def load_directory(path):
+    """The directory at ``path``, or None (with a note) when there is no such file"""
+    if not path or not os.path.exists(path):
+        print(f"School directory {path!r} not found; falling back to keyword checks")
+        return None
+    return SchoolDirectory.from_file(path)
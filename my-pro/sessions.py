@@ -0,0 +1,103 @@
+"""Server-side Flask sessions kept in SQLite and shared by all gunicorn workers.
+
+The cookie carries only a random session id; the session contents stay on
+the server, so the cookie stays a few dozen bytes however much is stored.
+"""
+import json
+import secrets
+import sqlite3
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.new = sid is None
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.old_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh id, e.g. on sign-in, so an old id is worthless"""
+        if not self.new:
+            self.old_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.new = True
+        self.modified = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
+    """
+
+    def __init__(self, path, cleanup_interval=3600):
+        self.path = path
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        conn = self._connect()
+        try:
+            conn.executescript(self.SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _execute(self, sql, params=()):
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self._execute('SELECT data FROM sessions WHERE id = ? AND expires > ?', (sid, time.time()))
+            if row:
+                return ServerSideSession(json.loads(row[0]), sid)
+        return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.old_sid:
+            self._execute('DELETE FROM sessions WHERE id = ?', (session.old_sid,))
+
+        if not session:
+            if session.modified and not session.new:
+                self._execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.modified:
+            expires = time.time() + app.permanent_session_lifetime.total_seconds()
+            self._execute('INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)',
+                          (session.sid, json.dumps(dict(session)), expires))
+            self._cleanup()
+
+        if session.modified or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup > self.cleanup_interval:
+            self._last_cleanup = now
+            self._execute('DELETE FROM sessions WHERE expires <= ?', (now,))
@@ -0,0 +1,794 @@
+"""Storage backends for TrustPaper users and admin notifications.
+
+The routes in main.py talk to a store object instead of reading and rewriting
+users.json / notifications.json themselves. Users are identified by
+(name, roll_no) and notifications by their integer id.
+"""
+import atexit
+import fcntl
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from performance import GroupStats, group_summary, performer, stat_deltas, student_average
+
+
+def load_data(filename):
+    if os.path.exists(filename):
+        with open(filename, 'r') as f:
+            return json.load(f)
+    return []
+
+
+def user_key(user):
+    return (user['name'], user['roll_no'])
+
+
+class JSONStore:
+    """users.json / notifications.json snapshots plus an append-only change log.
+
+    Writers take an exclusive lock on ``<users_file>.lock``, append one JSON
+    line per change to ``<users_file>.log`` and fsync the log in groups.
+    Every ``compact_every`` records the snapshots are rewritten atomically and
+    the log starts over with a header line carrying the next generation
+    number; a worker that sees a generation other than its own reloads the
+    snapshots. Each worker keeps the current state in memory and
+    only replays the log lines it has not seen yet, so a write costs the size
+    of the change rather than the size of the dataset.
+    """
+
+    def __init__(self, users_file, notifications_file, sync_every=32, sync_interval=1.0,
+                 compact_every=1000):
+        self.users_file = users_file
+        self.notifications_file = notifications_file
+        self.log_file = users_file + '.log'
+        self.lock_file = users_file + '.lock'
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self._thread_lock = threading.RLock()
+        self._generation = None
+        self._loaded = False
+        self._depth = 0
+        self._pending = []
+        self._unsynced = 0
+        self._last_sync = 0.0
+        atexit.register(self.sync)
+
+    # Locking and log replay
+
+    @contextmanager
+    def _locked(self, mode):
+        with self._thread_lock:
+            if self._depth:
+                # Already inside a write on this thread
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, mode)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_snapshots(self):
+        self._users = {}
+        self._by_name = {}
+        self._stats = GroupStats()
+        self._notifications = {}
+        for user in load_data(self.users_file):
+            self._put_user(None, user)
+        for notification in load_data(self.notifications_file):
+            self._notifications[notification['id']] = notification
+        self._next_id = max(self._notifications, default=0) + 1
+        self._offset = 0
+        self._log_records = 0
+        self._loaded = True
+
+    def _refresh(self):
+        try:
+            f = open(self.log_file, 'rb')
+        except FileNotFoundError:
+            f = io.BytesIO()
+        with f:
+            generation, header = _read_log_header(f)
+            if not self._loaded or generation != self._generation:
+                # First use, or another worker compacted the log
+                self._load_snapshots()
+                self._generation = generation
+                self._offset = header
+            f.seek(self._offset)
+            data = f.read()
+        # A line without its newline is a write still in progress (or a crashed one)
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            self._apply(json.loads(line))
+            self._log_records += 1
+        self._offset += end
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'put_user':
+            self._put_user(tuple(record['key']) if record.get('key') else None, record['user'])
+        elif op == 'delete_user':
+            self._delete_user(tuple(record['key']))
+        elif op == 'put_notification':
+            notification = record['notification']
+            self._notifications[notification['id']] = notification
+            self._next_id = max(self._next_id, notification['id'] + 1)
+        elif op == 'delete_notification':
+            self._notifications.pop(record['id'], None)
+
+    def _put_user(self, old_key, user):
+        key = user_key(user)
+        if old_key is not None and old_key != key:
+            self._delete_user(old_key)
+        if key not in self._users:
+            self._by_name.setdefault(key[0], []).append(key)
+        else:
+            self._stats.apply(self._users[key], -1)
+        self._users[key] = user
+        self._stats.apply(user, 1)
+
+    def _delete_user(self, key):
+        user = self._users.pop(key, None)
+        if user is not None:
+            self._stats.apply(user, -1)
+            keys = self._by_name[key[0]]
+            keys.remove(key)
+            if not keys:
+                del self._by_name[key[0]]
+        return user
+
+    @contextmanager
+    def _writing(self):
+        with self._locked(fcntl.LOCK_EX):
+            if self._depth:
+                yield
+                return
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                # Drop the half-applied in-memory state; it is rebuilt from disk
+                self._pending = []
+                self._loaded = False
+                raise
+            finally:
+                self._depth -= 1
+            self._write_pending()
+
+    def _record(self, record):
+        self._apply(record)
+        self._pending.append(record)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        data = b''.join(json.dumps(record).encode() + b'\n' for record in self._pending)
+        if not self._offset:
+            # A new log (or one holding only a torn line) starts with its generation
+            data = _log_header(self._generation) + data
+        fd = os.open(self.log_file, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            # Cut off a partial line left by a writer that crashed
+            os.ftruncate(fd, self._offset)
+            os.lseek(fd, self._offset, os.SEEK_SET)
+            os.write(fd, data)
+            self._unsynced += len(self._pending)
+            if (self._unsynced >= self.sync_every or
+                    time.monotonic() - self._last_sync >= self.sync_interval):
+                os.fsync(fd)
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+        finally:
+            os.close(fd)
+        self._offset += len(data)
+        self._log_records += len(self._pending)
+        self._pending = []
+        if self._log_records >= self.compact_every:
+            self._compact()
+
+    def sync(self):
+        """Flush log records that have been written but not yet fsync'd"""
+        if self._unsynced and os.path.exists(self.log_file):
+            fd = os.open(self.log_file, os.O_WRONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._unsynced = 0
+
+    def compact(self):
+        """Fold the change log into fresh snapshot files and start a new log"""
+        with self._writing():
+            self._compact()
+
+    def _compact(self):
+        _atomic_write_json(self.users_file, list(self._users.values()))
+        _atomic_write_json(self.notifications_file, list(self._notifications.values()))
+        header = _log_header(self._generation + 1)
+        tmp = self.log_file + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log_file)
+        self._generation += 1
+        self._offset = len(header)
+        self._log_records = 0
+        self._unsynced = 0
+
+    def version(self):
+        """Changes whenever any worker appends to or compacts the log"""
+        with self._locked(fcntl.LOCK_SH):
+            return (self._generation, self._offset)
+
+    @contextmanager
+    def batch(self):
+        """Apply several changes under one lock and append them as one write"""
+        with self._writing():
+            yield self
+
+    # Users
+
+    def get_user(self, name, roll_no=None):
+        with self._locked(fcntl.LOCK_SH):
+            if roll_no is not None:
+                return self._users.get((name, roll_no))
+            keys = self._by_name.get(name)
+            return self._users[keys[0]] if keys else None
+
+    def find_users(self, name):
+        with self._locked(fcntl.LOCK_SH):
+            return [self._users[key] for key in self._by_name.get(name, [])]
+
+    def existing_user_keys(self, keys):
+        """The subset of (name, roll_no) keys that already belong to a user"""
+        with self._locked(fcntl.LOCK_SH):
+            return {tuple(key) for key in keys if tuple(key) in self._users}
+
+    def list_users(self, status=None, class_name=None, school=None):
+        with self._locked(fcntl.LOCK_SH):
+            users = list(self._users.values())
+        return [user for user in users
+                if (status is None or user.get('status') == status) and
+                (class_name is None or user.get('class') == class_name) and
+                (school is None or user.get('school') == school)]
+
+    def count_users(self, status=None):
+        return len(self.list_users(status))
+
+    def page_users(self, status=None, class_name=None, school=None, prefix=None, after=None, limit=50):
+        """One page of users ordered by (name, roll_no) after the ``after`` key, plus the next key"""
+        users = self.list_users(status, class_name, school)
+        if prefix:
+            name_prefix = prefix.lower()
+            users = [user for user in users
+                     if user['name'].lower().startswith(name_prefix) or user['roll_no'].startswith(prefix)]
+        users.sort(key=user_key)
+        if after:
+            users = [user for user in users if user_key(user) > tuple(after)]
+        next_key = user_key(users[limit - 1]) if len(users) > limit else None
+        return users[:limit], next_key
+
+    def iter_users(self, status=None, class_name=None, school=None, prefix=None):
+        """All matching users in (name, roll_no) order, for exports"""
+        # Users already live in memory, so a single sorted pass is enough
+        users, _ = self.page_users(status, class_name, school, prefix, limit=sys.maxsize)
+        return iter(users)
+
+    def add_user(self, user):
+        with self._writing():
+            if user_key(user) in self._users:
+                return False
+            self._record({'op': 'put_user', 'user': user})
+        return True
+
+    def update_user(self, name, roll_no, changes):
+        with self._writing():
+            user = self._users.get((name, roll_no))
+            if user is None:
+                return None
+            user = dict(user, **changes)
+            self._record({'op': 'put_user', 'key': [name, roll_no], 'user': user})
+        return user
+
+    def delete_user(self, name, roll_no):
+        with self._writing():
+            user = self._users.get((name, roll_no))
+            if user is not None:
+                self._record({'op': 'delete_user', 'key': [name, roll_no]})
+        return user
+
+    # Class and school statistics, kept up to date as users change
+
+    def group_stats(self, scope):
+        with self._locked(fcntl.LOCK_SH):
+            return self._stats.groups(scope)
+
+    def group_stat(self, scope, key, top=5):
+        with self._locked(fcntl.LOCK_SH):
+            return self._stats.group(scope, key, top)
+
+    # Notifications
+
+    def list_notifications(self):
+        with self._locked(fcntl.LOCK_SH):
+            return list(self._notifications.values())
+
+    def get_notification(self, notification_id):
+        with self._locked(fcntl.LOCK_SH):
+            return self._notifications.get(notification_id)
+
+    def add_notification(self, notification):
+        with self._writing():
+            notification['id'] = self._next_id
+            self._record({'op': 'put_notification', 'notification': notification})
+        return notification
+
+    def delete_notification(self, notification_id):
+        with self._writing():
+            notification = self._notifications.get(notification_id)
+            if notification is not None:
+                self._record({'op': 'delete_notification', 'id': notification_id})
+        return notification
+
+    def delete_signup_notification(self, name, roll_no):
+        with self._writing():
+            notification = next((n for n in self._notifications.values()
+                                 if n.get('type') == 'signup_request' and
+                                 user_key(n['user']) == (name, roll_no)), None)
+            if notification is not None:
+                self._record({'op': 'delete_notification', 'id': notification['id']})
+        return notification
+
+
+def _log_header(generation):
+    return json.dumps({'generation': generation}).encode() + b'\n'
+
+
+def _read_log_header(f):
+    """(generation, header length) of a change log; a log without a header is generation 0"""
+    line = f.readline()
+    if line.endswith(b'\n'):
+        record = json.loads(line)
+        if 'generation' in record:
+            return record['generation'], len(line)
+    return 0, 0
+
+
+def _atomic_write_json(filename, data):
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class SQLiteStore:
+    """SQLite storage with indexes on the fields the routes look users up by.
+
+    Each record is kept as a JSON document next to the indexed columns, so
+    updating one student rewrites one row instead of the whole dataset.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            roll_no TEXT NOT NULL,
+            status TEXT,
+            class TEXT,
+            school TEXT,
+            data TEXT NOT NULL,
+            average REAL,
+            name_lower TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_name ON users (name);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_name_roll ON users (name, roll_no);
+        CREATE INDEX IF NOT EXISTS idx_users_status ON users (status);
+        CREATE INDEX IF NOT EXISTS idx_users_class ON users (class);
+        CREATE INDEX IF NOT EXISTS idx_users_school ON users (school);
+        CREATE INDEX IF NOT EXISTS idx_users_status_name ON users (status, name, roll_no);
+        CREATE INDEX IF NOT EXISTS idx_users_roll_no ON users (roll_no);
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT,
+            user_name TEXT,
+            user_roll_no TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_notifications_user
+            ON notifications (user_name, user_roll_no);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        CREATE TABLE IF NOT EXISTS group_stats (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (scope, key, metric)
+        ) WITHOUT ROWID;
+    """
+
+    # Created after the migration below, which adds the columns they index.
+    # SQLite's lower() only folds ASCII, so name searches use name_lower,
+    # lowercased in Python exactly as JSONStore does.
+    MIGRATED_INDEXES = """
+        DROP INDEX IF EXISTS idx_users_name_lower;
+        CREATE INDEX IF NOT EXISTS idx_users_class_average ON users (class, average);
+        CREATE INDEX IF NOT EXISTS idx_users_school_average ON users (school, average);
+        CREATE INDEX IF NOT EXISTS idx_users_name_folded ON users (name_lower);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect(write=False).conn
+        conn.executescript(self.SCHEMA)
+        self._migrate()
+        conn.executescript(self.MIGRATED_INDEXES)
+
+    def _migrate(self):
+        """Add the columns of later versions to a database created before they existed"""
+        with self._connect() as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+            if 'average' not in columns:
+                conn.execute('ALTER TABLE users ADD COLUMN average REAL')
+                for row_id, data in conn.execute('SELECT id, data FROM users').fetchall():
+                    user = json.loads(data)
+                    conn.execute('UPDATE users SET average = ? WHERE id = ?', (student_average(user), row_id))
+                    self._apply_stats(conn, user, 1)
+            if 'name_lower' not in columns:
+                conn.execute('ALTER TABLE users ADD COLUMN name_lower TEXT')
+                conn.executemany('UPDATE users SET name_lower = ? WHERE id = ?',
+                                 [(name.lower(), row_id) for row_id, name in conn.execute('SELECT id, name FROM users')])
+
+    def _connect(self, write=True):
+        conn = getattr(self._local, 'conn', None)
+        # Connections are never shared with a forked gunicorn worker
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return _Transaction(conn, self._local, write)
+
+    @contextmanager
+    def batch(self):
+        """Run several changes in a single transaction"""
+        with self._connect():
+            yield self
+
+    def version(self):
+        """Counter that changes whenever any worker commits a change"""
+        with self._connect(write=False) as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def is_empty(self):
+        with self._connect(write=False) as conn:
+            row = conn.execute('SELECT (SELECT COUNT(*) FROM users) + '
+                               '(SELECT COUNT(*) FROM notifications)').fetchone()
+        return row[0] == 0
+
+    def import_json(self, users_file, notifications_file):
+        """Copy users.json / notifications.json into a new database, once.
+
+        A 'seeded' marker in meta records that this ran, so a database that
+        is empty because every record was removed is not seeded again.
+        """
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'seeded'").fetchone():
+                return
+            # Databases created before the marker existed were seeded if they hold anything
+            if self.is_empty():
+                for user in load_data(users_file):
+                    self.add_user(user)
+                for notification in load_data(notifications_file):
+                    notification_id = notification.get('id')
+                    if conn.execute('SELECT 1 FROM notifications WHERE id = ?', (notification_id,)).fetchone():
+                        # Older files reused ids after a removal; give the duplicate a new one
+                        notification_id = None
+                    self._insert_notification(notification, notification_id)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('seeded', 1)")
+
+    # Users
+
+    @staticmethod
+    def _user_row(user):
+        return (user['name'], user['roll_no'], user.get('status'), user.get('class'),
+                user.get('school'), json.dumps(user), student_average(user), user['name'].lower())
+
+    @staticmethod
+    def _apply_stats(conn, user, sign):
+        """Add (sign=1) or remove (sign=-1) one user's share of the group statistics"""
+        deltas = stat_deltas(user)
+        if not deltas:
+            return
+        conn.executemany(
+            'INSERT INTO group_stats (scope, key, metric, total, count) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (scope, key, metric) DO UPDATE '
+            'SET total = total + excluded.total, count = count + excluded.count',
+            [(scope, key, metric, sign * total, sign * count) for scope, key, metric, total, count in deltas])
+        if sign < 0:
+            conn.executemany('DELETE FROM group_stats WHERE scope = ? AND key = ? AND count = 0',
+                             {(scope, key) for scope, key, _, _, _ in deltas})
+
+    def _query_users(self, where='', params=(), limit=-1):
+        with self._connect(write=False) as conn:
+            rows = conn.execute(f'SELECT data FROM users {where} ORDER BY id LIMIT ?',
+                                params + (limit,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_user(self, name, roll_no=None):
+        if roll_no is None:
+            users = self._query_users('WHERE name = ?', (name,), limit=1)
+        else:
+            users = self._query_users('WHERE name = ? AND roll_no = ?', (name, roll_no))
+        return users[0] if users else None
+
+    def find_users(self, name):
+        return self._query_users('WHERE name = ?', (name,))
+
+    def existing_user_keys(self, keys, chunk_size=400):
+        """The subset of (name, roll_no) keys that already belong to a user.
+
+        Each chunk is one lookup against the UNIQUE (name, roll_no) index.
+        """
+        keys = [tuple(key) for key in keys]
+        existing = set()
+        with self._connect(write=False) as conn:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                values = ', '.join(['(?, ?)'] * len(chunk))
+                rows = conn.execute(f'SELECT name, roll_no FROM users WHERE (name, roll_no) IN (VALUES {values})',
+                                    [value for key in chunk for value in key]).fetchall()
+                existing.update(rows)
+        return existing
+
+    @staticmethod
+    def _filters(status, class_name, school):
+        conditions = []
+        params = ()
+        for column, value in (('status', status), ('class', class_name), ('school', school)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params += (value,)
+        return conditions, params
+
+    def list_users(self, status=None, class_name=None, school=None):
+        conditions, params = self._filters(status, class_name, school)
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return self._query_users(where, params)
+
+    def page_users(self, status=None, class_name=None, school=None, prefix=None, after=None, limit=50):
+        """One page of users ordered by (name, roll_no) after the ``after`` key, plus the next key.
+
+        Keyset pagination walks the (name, roll_no) index, so every page costs
+        the same however deep into the list it is.
+        """
+        conditions, params = self._filters(status, class_name, school)
+        if prefix:
+            # Case-insensitive name prefix or roll number prefix, both as index range scans
+            conditions.append('((name_lower >= ? AND name_lower < ?) OR (roll_no >= ? AND roll_no < ?))')
+            params += (prefix.lower(), prefix.lower() + '\U0010ffff', prefix, prefix + '\U0010ffff')
+        if after:
+            conditions.append('(name > ? OR (name = ? AND roll_no > ?))')
+            params += (after[0], after[0], after[1])
+        where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+        with self._connect(write=False) as conn:
+            rows = conn.execute(f'SELECT data FROM users {where} ORDER BY name, roll_no LIMIT ?',
+                                params + (limit + 1,)).fetchall()
+        users = [json.loads(row[0]) for row in rows]
+        next_key = user_key(users[limit - 1]) if len(users) > limit else None
+        return users[:limit], next_key
+
+    def iter_users(self, status=None, class_name=None, school=None, prefix=None, batch_size=500):
+        """All matching users in (name, roll_no) order, for exports.
+
+        Reads one keyset page at a time, so memory stays flat and no read
+        transaction is held open while the caller streams the rows out.
+        """
+        after = None
+        while True:
+            users, after = self.page_users(status, class_name, school, prefix, after, batch_size)
+            yield from users
+            if after is None:
+                return
+
+    def count_users(self, status=None):
+        with self._connect(write=False) as conn:
+            if status is None:
+                row = conn.execute('SELECT COUNT(*) FROM users').fetchone()
+            else:
+                row = conn.execute('SELECT COUNT(*) FROM users WHERE status = ?', (status,)).fetchone()
+        return row[0]
+
+    def add_user(self, user):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO users (name, roll_no, status, class, school, data, average, name_lower) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self._user_row(user))
+            if cursor.rowcount == 1:
+                self._apply_stats(conn, user, 1)
+        return cursor.rowcount == 1
+
+    def update_user(self, name, roll_no, changes):
+        with self._connect() as conn:
+            user = self.get_user(name, roll_no)
+            if user is None:
+                return None
+            self._apply_stats(conn, user, -1)
+            user.update(changes)
+            conn.execute(
+                'UPDATE users SET name = ?, roll_no = ?, status = ?, class = ?, school = ?, data = ?, average = ?, '
+                'name_lower = ? WHERE name = ? AND roll_no = ?', self._user_row(user) + (name, roll_no))
+            self._apply_stats(conn, user, 1)
+        return user
+
+    def delete_user(self, name, roll_no):
+        with self._connect() as conn:
+            user = self.get_user(name, roll_no)
+            if user is not None:
+                conn.execute('DELETE FROM users WHERE name = ? AND roll_no = ?', (name, roll_no))
+                self._apply_stats(conn, user, -1)
+        return user
+
+    # Class and school statistics, kept up to date in the same transaction as every user write
+
+    def group_stats(self, scope):
+        """Statistics for every class (or school), without top performers"""
+        with self._connect(write=False) as conn:
+            rows = conn.execute('SELECT key, metric, total, count FROM group_stats WHERE scope = ? '
+                                'ORDER BY key', (scope,)).fetchall()
+        groups = {}
+        for key, metric, total, count in rows:
+            groups.setdefault(key, {})[metric] = (total, count)
+        return [group_summary(scope, key, metrics) for key, metrics in groups.items()]
+
+    def group_stat(self, scope, key, top=5):
+        """Statistics for one class or school, with its ``top`` best averages"""
+        if scope not in ('class', 'school'):
+            raise ValueError(f"Unknown statistics scope: {scope}")
+        with self._connect(write=False) as conn:
+            rows = conn.execute('SELECT metric, total, count FROM group_stats WHERE scope = ? AND key = ?',
+                                (scope, key)).fetchall()
+            if not rows:
+                return None
+            # Walks the (class, average) or (school, average) index from the top
+            top_rows = conn.execute(
+                f"SELECT name, roll_no, average FROM users WHERE {scope} = ? AND average IS NOT NULL "
+                f"ORDER BY average DESC, name, roll_no LIMIT ?", (key, top)).fetchall()
+        return group_summary(scope, key, {metric: (total, count) for metric, total, count in rows},
+                             [performer(name, roll_no, average) for name, roll_no, average in top_rows])
+
+    # Notifications
+
+    def _query_notifications(self, where='', params=(), limit=-1):
+        with self._connect(write=False) as conn:
+            rows = conn.execute(f'SELECT id, data FROM notifications {where} ORDER BY id LIMIT ?',
+                                params + (limit,)).fetchall()
+        notifications = []
+        for notification_id, data in rows:
+            notification = json.loads(data)
+            notification['id'] = notification_id
+            notifications.append(notification)
+        return notifications
+
+    def _insert_notification(self, notification, notification_id=None):
+        user = notification.get('user') or {}
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO notifications (id, type, user_name, user_roll_no, data) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (notification_id, notification.get('type'), user.get('name'),
+                 user.get('roll_no'), json.dumps(notification)))
+        notification['id'] = cursor.lastrowid
+        return notification
+
+    def list_notifications(self):
+        return self._query_notifications()
+
+    def get_notification(self, notification_id):
+        notifications = self._query_notifications('WHERE id = ?', (notification_id,))
+        return notifications[0] if notifications else None
+
+    def add_notification(self, notification):
+        return self._insert_notification(notification)
+
+    def delete_notification(self, notification_id):
+        with self._connect() as conn:
+            notification = self.get_notification(notification_id)
+            if notification is not None:
+                conn.execute('DELETE FROM notifications WHERE id = ?', (notification_id,))
+        return notification
+
+    def delete_signup_notification(self, name, roll_no):
+        with self._connect() as conn:
+            notifications = self._query_notifications(
+                "WHERE type = 'signup_request' AND user_name = ? AND user_roll_no = ?",
+                (name, roll_no), limit=1)
+            if notifications:
+                conn.execute('DELETE FROM notifications WHERE id = ?', (notifications[0]['id'],))
+        return notifications[0] if notifications else None
+
+
+class _Transaction:
+    """Re-entrant write transaction on a per-thread connection"""
+
+    def __init__(self, conn, local, write):
+        self.conn = conn
+        self.local = local
+        self.write = write
+
+    def __enter__(self):
+        if self.local.depth == 0:
+            # Writers take the lock up front so read-then-write never deadlocks
+            self.conn.execute('BEGIN IMMEDIATE' if self.write else 'BEGIN')
+            self.local.changes = self.conn.total_changes
+        self.local.depth += 1
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            if exc_type:
+                self.conn.execute('ROLLBACK')
+                return False
+            if self.conn.total_changes != self.local.changes:
+                # Every committed change bumps the version that read caches watch
+                self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            self.conn.execute('COMMIT')
+        return False
+
+
+class ReadCache:
+    """Per-worker cache of the notification list the admin dashboard shows.
+
+    The list is re-read only when the store's version changes. User lookups
+    and counts are not cached here: the store answers them from its indexes,
+    which is cheaper than rebuilding any view of every user after a write.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._version = None
+        self._notifications = None
+
+    def notifications(self):
+        version = self.store.version()
+        notifications = self._notifications
+        if notifications is not None and version == self._version:
+            return notifications
+        with self._lock:
+            if self._notifications is None or version != self._version:
+                # Version is read before the data, so a concurrent write only
+                # causes one more reload on the next call
+                self._notifications, self._version = self.store.list_notifications(), version
+            return self._notifications
+
+
+def create_store(backend, users_file, notifications_file, db_path=None):
+    """Build the configured store; a new SQLite database is seeded from the JSON files"""
+    if backend == 'json':
+        return JSONStore(users_file, notifications_file)
+    if backend == 'sqlite':
+        store = SQLiteStore(db_path)
+        store.import_json(users_file, notifications_file)
+        return store
+    raise ValueError(f"Unknown storage backend: {backend}")
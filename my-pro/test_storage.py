@@ -0,0 +1,44 @@
+import json
+
+from storage import JSONStore, SQLiteStore
+
+
+def make_user(name):
+    return {'name': name, 'roll_no': '1', 'email': f'{name}@example.com', 'class': '9th',
+            'school': 'Hill High School', 'status': 'approved', 'unit_marks': {}}
+
+
+def test_idle_worker_reloads_after_other_workers_compact(tmp_path):
+    users_file = str(tmp_path / 'users.json')
+    notifications_file = str(tmp_path / 'notifications.json')
+    a = JSONStore(users_file, notifications_file, compact_every=4)
+    b = JSONStore(users_file, notifications_file, compact_every=4)
+    for i in range(3):
+        a.add_user(make_user(f'a{i}'))
+    assert a.count_users() == 3
+
+    # b compacts the log several times while a sits idle; the log file's
+    # inode can be reused, so a must still notice the snapshots changed
+    for i in range(14):
+        b.add_user(make_user(f'b{i}'))
+    assert a.count_users() == 17
+
+    a.add_user(make_user('zz'))
+    fresh = JSONStore(users_file, notifications_file)
+    assert fresh.count_users() == 18
+    assert b.get_user('b13', '1') is not None
+
+
+def test_sqlite_seed_renumbers_duplicate_notification_ids(tmp_path):
+    users_file = tmp_path / 'users.json'
+    notifications_file = tmp_path / 'notifications.json'
+    users_file.write_text('[]')
+    notifications_file.write_text(json.dumps([
+        {'id': 2, 'type': 'signup', 'user': make_user('a')},
+        {'id': 2, 'type': 'signup', 'user': make_user('b')},
+    ]))
+    store = SQLiteStore(str(tmp_path / 'trustpaper.db'))
+    store.import_json(str(users_file), str(notifications_file))
+    notifications = store.list_notifications()
+    assert sorted(n['user']['name'] for n in notifications) == ['a', 'b']
+    assert len({n['id'] for n in notifications}) == 2